@@ -0,0 +1,47 @@
+"""Helpers for driving coroutines from synchronous code paths."""
+from __future__ import annotations
+
+import asyncio
+import atexit
+import threading
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """Return the process-wide event loop that sync code runs coroutines on, starting it on first use."""
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="async-utils", daemon=True).start()
+            _LOOP = loop
+    return _LOOP
+
+
+def _stop_loop() -> None:
+    if _LOOP is not None:
+        _LOOP.call_soon_threadsafe(_LOOP.stop)
+
+
+atexit.register(_stop_loop)
+
+
+def run_async(coro: Awaitable[T]) -> T:
+    """Run a coroutine from sync code, even when called inside a running event loop.
+
+    Every call shares one long-lived loop, so loop-bound resources such as async HTTP connection
+    pools are reused across calls instead of being rebuilt by each asyncio.run.
+    """
+    loop = background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("run_async cannot block the background loop it would run on")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
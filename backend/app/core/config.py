@@ -36,6 +36,18 @@ class Settings(BaseSettings):
     ollama_max_columns: int = Field(default=15, description="Maximum number of columns per table to show in Ollama prompt")
     default_llm_provider: str = Field(default="openai", description="Default LLM provider: openai, anthropic, or ollama")
     use_llm_for_sql: bool = Field(default=True, description="Use LLM for prompt-to-SQL generation")
+    openai_embedding_model: str = Field(
+        default="text-embedding-3-small", description="OpenAI model used to embed prompts for the semantic cache"
+    )
+    enable_semantic_cache: bool = Field(
+        default=False, description="Reuse prompt-to-SQL results for similar prompts (needs an OpenAI embedding model)"
+    )
+    semantic_cache_threshold: float = Field(
+        default=0.9, description="Minimum cosine similarity for a semantic cache hit"
+    )
+    semantic_cache_ttl_seconds: float = Field(
+        default=300.0, description="Seconds before a cached prompt-to-SQL result expires"
+    )
 
     # Vector Search Configuration
     enable_vector_search: bool = Field(default=False, description="Enable vector search for semantic discovery")
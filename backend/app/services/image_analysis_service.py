@@ -1,10 +1,14 @@
 """Image analysis service for detecting and understanding visual elements in email campaigns."""
 from __future__ import annotations
 
+import asyncio
 import base64
 import json
+import mimetypes
+import mmap
 import uuid
-from typing import Any, Dict, List, Optional
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
 from urllib.parse import urlparse
 
 import httpx
@@ -13,6 +17,19 @@ from ..core.config import settings
 from .llm_service import LLMService
 
 
+def _encode_image_file(image_path: Union[str, Path]) -> str:
+    """Base64-encode an image file as a data URL, memory-mapping it instead of reading a copy."""
+    path = Path(image_path)
+    mime_type = mimetypes.guess_type(path.name)[0] or "image/jpeg"
+    with open(path, "rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                encoded = base64.b64encode(mapped)
+        except ValueError:  # empty files cannot be mapped
+            encoded = base64.b64encode(f.read())
+    return f"data:{mime_type};base64,{encoded.decode('ascii')}"
+
+
 class ImageAnalysisService:
     """Service for analyzing marketing email images and detecting visual elements."""
 
@@ -43,15 +60,19 @@ class ImageAnalysisService:
         campaign_id: Optional[str] = None,
         campaign_name: Optional[str] = None,
         analysis_type: str = "full",
+        image_path: Optional[Union[str, Path]] = None,
     ) -> Dict[str, Any]:
         """Analyze an image and detect visual elements."""
-        if not image_url and not image_base64:
-            raise ValueError("Either image_url or image_base64 must be provided")
+        if not image_url and not image_base64 and not image_path:
+            raise ValueError("One of image_url, image_base64 or image_path must be provided")
 
         image_id = str(uuid.uuid4())
 
         # Use OpenAI vision API if available, otherwise fall back to LLM-based analysis
         if self.llm_service and self.llm_service.provider == "openai" and settings.openai_api_key:
+            # Only the vision API needs the file contents, so encode lazily here
+            if image_path and not image_url and not image_base64:
+                image_base64 = _encode_image_file(image_path)
             return self._analyze_with_openai_vision(
                 image_url, image_base64, image_id, campaign_id, campaign_name, analysis_type
             )
@@ -62,6 +83,33 @@ class ImageAnalysisService:
         else:
             return self._analyze_basic(image_url, image_base64, image_id, campaign_id, campaign_name)
 
+    async def analyze_image_async(
+        self,
+        image_url: Optional[str] = None,
+        image_base64: Optional[str] = None,
+        campaign_id: Optional[str] = None,
+        campaign_name: Optional[str] = None,
+        analysis_type: str = "full",
+        image_path: Optional[Union[str, Path]] = None,
+    ) -> Dict[str, Any]:
+        """Async variant of analyze_image so batches of images can be analyzed concurrently."""
+        if not image_url and not image_base64 and not image_path:
+            raise ValueError("One of image_url, image_base64 or image_path must be provided")
+
+        image_id = str(uuid.uuid4())
+
+        if self.llm_service and self.llm_service.provider == "openai" and settings.openai_api_key:
+            if image_path and not image_url and not image_base64:
+                # Read and encode off the event loop so disk I/O overlaps other in-flight vision calls
+                image_base64 = await asyncio.to_thread(_encode_image_file, image_path)
+            return await self._analyze_with_openai_vision_async(
+                image_url, image_base64, image_id, campaign_id, campaign_name, analysis_type
+            )
+        elif self.llm_service:
+            return self._analyze_with_llm(image_url, image_base64, image_id, campaign_id, campaign_name, analysis_type)
+        else:
+            return self._analyze_basic(image_url, image_base64, image_id, campaign_id, campaign_name)
+
     def _analyze_with_openai_vision(
         self,
         image_url: Optional[str],
@@ -73,26 +121,63 @@ class ImageAnalysisService:
     ) -> Dict[str, Any]:
         """Analyze image using OpenAI Vision API."""
         try:
-            from openai import OpenAI
-
-            client = OpenAI(api_key=settings.openai_api_key)
-
-            # Prepare image content
-            image_content = []
-            if image_url:
-                image_content.append({"type": "image_url", "image_url": {"url": image_url}})
-            elif image_base64:
-                # Ensure base64 data has proper prefix
-                if not image_base64.startswith("data:image"):
-                    image_content.append(
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
-                    )
-                else:
-                    image_content.append({"type": "image_url", "image_url": {"url": image_base64}})
-
-            # Build analysis prompt based on type
-            if analysis_type == "visual_elements":
-                prompt = """Analyze this marketing email image and identify all visual elements. For each element, provide:
+            client = self.llm_service._get_openai_client()
+            response = client.chat.completions.create(
+                model="gpt-4o",  # Use vision-capable model
+                messages=self._build_vision_messages(image_url, image_base64, campaign_name, analysis_type),
+                max_tokens=2000,
+                temperature=0.3,
+            )
+            return self._parse_vision_response(response.choices[0].message.content, image_id, campaign_id)
+        except Exception as e:
+            return self._vision_error(image_id, campaign_id, e)
+
+    async def _analyze_with_openai_vision_async(
+        self,
+        image_url: Optional[str],
+        image_base64: Optional[str],
+        image_id: str,
+        campaign_id: Optional[str],
+        campaign_name: Optional[str],
+        analysis_type: str,
+    ) -> Dict[str, Any]:
+        """Analyze image using the async OpenAI Vision API."""
+        try:
+            client = self.llm_service._get_async_openai_client()
+            response = await client.chat.completions.create(
+                model="gpt-4o",  # Use vision-capable model
+                messages=self._build_vision_messages(image_url, image_base64, campaign_name, analysis_type),
+                max_tokens=2000,
+                temperature=0.3,
+            )
+            return self._parse_vision_response(response.choices[0].message.content, image_id, campaign_id)
+        except Exception as e:
+            return self._vision_error(image_id, campaign_id, e)
+
+    def _build_vision_messages(
+        self,
+        image_url: Optional[str],
+        image_base64: Optional[str],
+        campaign_name: Optional[str],
+        analysis_type: str,
+    ) -> List[Dict[str, Any]]:
+        """Build the chat messages for a vision analysis request."""
+        # Prepare image content
+        image_content = []
+        if image_url:
+            image_content.append({"type": "image_url", "image_url": {"url": image_url}})
+        elif image_base64:
+            # Ensure base64 data has proper prefix
+            if not image_base64.startswith("data:image"):
+                image_content.append(
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+                )
+            else:
+                image_content.append({"type": "image_url", "image_url": {"url": image_base64}})
+
+        # Build analysis prompt based on type
+        if analysis_type == "visual_elements":
+            prompt = """Analyze this marketing email image and identify all visual elements. For each element, provide:
 1. Element type (product, text, CTA button, logo, background, etc.)
 2. Description
 3. Position (if discernible)
@@ -100,14 +185,14 @@ class ImageAnalysisService:
 5. Text content (if any)
 
 Return as structured JSON with a 'visual_elements' array."""
-            elif analysis_type == "colors":
-                prompt = """Identify the dominant colors in this marketing email image. List the top 5-7 colors as hex codes or color names. Also analyze the color palette and how it relates to marketing effectiveness."""
-            elif analysis_type == "text":
-                prompt = """Extract all text content from this marketing email image. Include headlines, body text, CTAs, and any other text elements."""
-            elif analysis_type == "composition":
-                prompt = """Analyze the composition and layout of this marketing email image. Describe the visual hierarchy, balance, focal points, and overall design structure."""
-            else:  # full
-                prompt = """Perform a comprehensive analysis of this marketing email image. Include:
+        elif analysis_type == "colors":
+            prompt = """Identify the dominant colors in this marketing email image. List the top 5-7 colors as hex codes or color names. Also analyze the color palette and how it relates to marketing effectiveness."""
+        elif analysis_type == "text":
+            prompt = """Extract all text content from this marketing email image. Include headlines, body text, CTAs, and any other text elements."""
+        elif analysis_type == "composition":
+            prompt = """Analyze the composition and layout of this marketing email image. Describe the visual hierarchy, balance, focal points, and overall design structure."""
+        else:  # full
+            prompt = """Perform a comprehensive analysis of this marketing email image. Include:
 1. Overall description
 2. All visual elements (products, text, CTAs, logos, etc.) with positions and colors
 3. Dominant color palette
@@ -117,71 +202,66 @@ Return as structured JSON with a 'visual_elements' array."""
 
 Return structured JSON with fields: visual_elements (array), dominant_colors (array), composition_analysis (string), text_content (string), overall_description (string), marketing_relevance (string)."""
 
-            if campaign_name:
-                prompt += f"\n\nContext: This image is from campaign '{campaign_name}'."
-
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        *image_content,
-                    ],
-                }
-            ]
+        if campaign_name:
+            prompt += f"\n\nContext: This image is from campaign '{campaign_name}'."
 
-            response = client.chat.completions.create(
-                model="gpt-4o",  # Use vision-capable model
-                messages=messages,
-                max_tokens=2000,
-                temperature=0.3,
-            )
-
-            content = response.choices[0].message.content.strip()
-
-            # Try to parse JSON response
-            try:
-                if content.startswith("```json"):
-                    content = content.split("```json")[1].split("```")[0].strip()
-                elif content.startswith("```"):
-                    content = content.split("```")[1].split("```")[0].strip()
-                
-                parsed = json.loads(content)
-            except json.JSONDecodeError:
-                # If not JSON, create structured response from text
-                parsed = {
-                    "overall_description": content,
-                    "visual_elements": [],
-                    "dominant_colors": [],
-                    "composition_analysis": None,
-                    "text_content": None,
-                    "marketing_relevance": None,
-                }
-
-            # Normalize response structure
-            result = {
-                "image_id": image_id,
-                "campaign_id": campaign_id,
-                "visual_elements": parsed.get("visual_elements", []),
-                "dominant_colors": parsed.get("dominant_colors", []),
-                "composition_analysis": parsed.get("composition_analysis"),
-                "text_content": parsed.get("text_content"),
-                "overall_description": parsed.get("overall_description", content),
-                "marketing_relevance": parsed.get("marketing_relevance"),
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    *image_content,
+                ],
             }
+        ]
 
-            return result
+    def _parse_vision_response(
+        self, content: str, image_id: str, campaign_id: Optional[str]
+    ) -> Dict[str, Any]:
+        """Normalize a vision model reply into the analysis result structure."""
+        content = content.strip()
 
-        except Exception as e:
-            return {
-                "image_id": image_id,
-                "campaign_id": campaign_id,
-                "error": f"OpenAI Vision API error: {str(e)}",
+        # Try to parse JSON response
+        try:
+            if content.startswith("```json"):
+                content = content.split("```json")[1].split("```")[0].strip()
+            elif content.startswith("```"):
+                content = content.split("```")[1].split("```")[0].strip()
+            
+            parsed = json.loads(content)
+        except json.JSONDecodeError:
+            # If not JSON, create structured response from text
+            parsed = {
+                "overall_description": content,
                 "visual_elements": [],
                 "dominant_colors": [],
-                "overall_description": "Analysis failed",
+                "composition_analysis": None,
+                "text_content": None,
+                "marketing_relevance": None,
             }
 
+        # Normalize response structure
+        return {
+            "image_id": image_id,
+            "campaign_id": campaign_id,
+            "visual_elements": parsed.get("visual_elements", []),
+            "dominant_colors": parsed.get("dominant_colors", []),
+            "composition_analysis": parsed.get("composition_analysis"),
+            "text_content": parsed.get("text_content"),
+            "overall_description": parsed.get("overall_description", content),
+            "marketing_relevance": parsed.get("marketing_relevance"),
+        }
+
+    def _vision_error(self, image_id: str, campaign_id: Optional[str], error: Exception) -> Dict[str, Any]:
+        return {
+            "image_id": image_id,
+            "campaign_id": campaign_id,
+            "error": f"OpenAI Vision API error: {str(error)}",
+            "visual_elements": [],
+            "dominant_colors": [],
+            "overall_description": "Analysis failed",
+        }
+
     def _analyze_with_llm(
         self,
         image_url: Optional[str],
@@ -266,18 +346,14 @@ Return as JSON with correlations array, each containing: element_type, element_d
                 )
                 content = response.content[0].text.strip()
             else:  # ollama
-                client = self.llm_service._get_ollama_client()
-                response = client.post(
-                    "/api/chat",
-                    json={
+                result = self.llm_service._ollama_chat(
+                    {
                         "model": settings.ollama_model,
                         "messages": [{"role": "user", "content": prompt}],
                         "stream": False,
                         "options": {"temperature": 0.5, "num_predict": 1500},
-                    },
+                    }
                 )
-                response.raise_for_status()
-                result = response.json()
                 content = result["message"]["content"].strip()
 
             # Parse JSON response
@@ -1,80 +1,265 @@
 """LLM service abstraction for OpenAI, Anthropic, and Ollama integrations."""
 from __future__ import annotations
 
-import json
+import asyncio
+import atexit
+import hashlib
+import logging
 import re
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, ClassVar, Dict, List, Mapping, Optional, Sequence, Tuple, Union
 
 import httpx
+import orjson
 
 from ..core.config import settings
 
+logger = logging.getLogger(__name__)
+
+_CONTEXT_CACHE_SIZE = 32
+_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=40)
+_OLLAMA_RETRIES = 3
+
+# Any statement that writes data or changes the schema or permissions is rejected outright. Whole-word match, so
+# identifiers such as created_at or update_ts are not rejected. Shared with the prompt-to-SQL service.
+_UNSAFE_SQL_RE = re.compile(
+    r"\b(DROP|DELETE|INSERT|UPDATE|ALTER|TRUNCATE|CREATE|EXEC|GRANT|REVOKE|ATTACH|DETACH)\b", re.IGNORECASE
+)
+# Prompts that explicitly ask for a destructive statement never reach the LLM.
+_UNSAFE_PROMPT_RE = re.compile(
+    r"\b(drop\s+table|delete\s+from|delete\s+all|truncate\s+table|insert\s+into|alter\s+table|update\s+\w+\s+set)\b",
+    re.IGNORECASE,
+)
+
+_SQL_TABLE_RE = re.compile(r'FROM\s+"?(\w+)"?|JOIN\s+"?(\w+)"?', re.IGNORECASE)
+_SQL_QUOTED_IDENTIFIER_RE = re.compile(r'"([^"]+)"')
+_SQL_QUOTED_ALIAS_RE = re.compile(r'\bAS\s+"([^"]+)"', re.IGNORECASE)
+
+# Provider SDK classes, imported lazily on first use so they stay optional.
+_openai_cls: Optional[type] = None
+_async_openai_cls: Optional[type] = None
+_anthropic_cls: Optional[type] = None
+
+
+def _dumps(value: Any) -> str:
+    """Serialize prompt context to JSON, stringifying anything orjson can't encode."""
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+@dataclass(slots=True)
+class TableMeta:
+    """Registry metadata for one table, decoded once per generate_sql call."""
+
+    table_name: str
+    columns: List[str] = field(default_factory=list)
+    business: str = ""
+    category: str = ""
+    dataset_name: str = ""
+
+    @classmethod
+    def from_mapping(cls, table: Mapping[str, Any]) -> "TableMeta":
+        columns = table.get("columns") or []
+        if isinstance(columns, (str, bytes)):
+            try:
+                columns = orjson.loads(columns)
+            except orjson.JSONDecodeError:
+                columns = []
+        return cls(
+            table_name=table.get("table_name") or "",
+            columns=list(columns),
+            business=table.get("business") or "",
+            category=table.get("category") or "",
+            dataset_name=table.get("dataset_name") or "",
+        )
+
+
+def _close_async_client(loop: asyncio.AbstractEventLoop, client: Any, wait: bool = True) -> None:
+    """Close an async provider client on the loop that owns its connection pool, if that loop still runs."""
+    if client.is_closed() or not loop.is_running():
+        return
+    future = asyncio.run_coroutine_threadsafe(client.close(), loop)
+    if wait:
+        future.result(timeout=5)
+
 
 class LLMService:
     """Unified LLM service supporting multiple providers."""
 
+    # Provider clients are shared by every instance so requests reuse one connection pool.
+    _clients: ClassVar[Dict[Tuple[str, str], Any]] = {}
+    # Async connection pools are bound to the loop that created them, so AsyncOpenAI clients are kept per loop.
+    _async_clients: ClassVar[Dict[asyncio.AbstractEventLoop, Any]] = {}
+    _clients_lock: ClassVar[threading.Lock] = threading.Lock()
+
     def __init__(self, provider: str = "openai") -> None:
         self.provider = provider
-        self._client: Any = None
+        self._context_cache: Dict[str, str] = {}
+
+    @staticmethod
+    def _client_key(provider: str, secret: str) -> Tuple[str, str]:
+        return provider, hashlib.blake2b(secret.encode(), digest_size=16).hexdigest()
 
     def _get_openai_client(self):
-        """Lazy-load OpenAI client."""
-        if self._client is None:
+        """Lazy-load the shared OpenAI client."""
+        global _openai_cls
+        key = self._client_key("openai", settings.openai_api_key)
+        client = LLMService._clients.get(key)
+        if client is not None:
+            return client
+
+        if _openai_cls is None:
             try:
                 from openai import OpenAI
-
-                if not settings.openai_api_key:
-                    raise ValueError("OpenAI API key not configured")
-                self._client = OpenAI(api_key=settings.openai_api_key)
             except ImportError:
                 raise ImportError("openai package not installed. Run: pip install openai")
-        return self._client
+            _openai_cls = OpenAI
+
+        if not settings.openai_api_key:
+            raise ValueError("OpenAI API key not configured")
+        with LLMService._clients_lock:
+            client = LLMService._clients.get(key)
+            if client is None:
+                client = _openai_cls(
+                    api_key=settings.openai_api_key, http_client=httpx.Client(limits=_HTTP_LIMITS)
+                )
+                LLMService._clients[key] = client
+        return client
+
+    def _get_async_openai_client(self):
+        """Lazy-load the shared AsyncOpenAI client for the running event loop."""
+        global _async_openai_cls
+        loop = asyncio.get_running_loop()
+        client = LLMService._async_clients.get(loop)
+        if client is not None and client.api_key == settings.openai_api_key:
+            return client
+
+        if _async_openai_cls is None:
+            try:
+                from openai import AsyncOpenAI
+            except ImportError:
+                raise ImportError("openai package not installed. Run: pip install openai")
+            _async_openai_cls = AsyncOpenAI
+
+        if not settings.openai_api_key:
+            raise ValueError("OpenAI API key not configured")
+        client = _async_openai_cls(
+            api_key=settings.openai_api_key, http_client=httpx.AsyncClient(limits=_HTTP_LIMITS)
+        )
+        with LLMService._clients_lock:
+            # Clients of loops that have since closed can no longer be used or closed; just drop them
+            for closed_loop in [other for other in LLMService._async_clients if other.is_closed()]:
+                del LLMService._async_clients[closed_loop]
+            previous = LLMService._async_clients.get(loop)
+            LLMService._async_clients[loop] = client
+        if previous is not None:
+            # Replaced after an API key change
+            _close_async_client(loop, previous, wait=False)
+        # Close the pool before the loop goes away at interpreter exit; atexit runs this ahead of the
+        # loop's own shutdown hook, which was registered first
+        atexit.register(_close_async_client, loop, client)
+        return client
 
     def _get_anthropic_client(self):
-        """Lazy-load Anthropic client."""
-        if self._client is None:
+        """Lazy-load the shared Anthropic client."""
+        global _anthropic_cls
+        key = self._client_key("anthropic", settings.anthropic_api_key)
+        client = LLMService._clients.get(key)
+        if client is not None:
+            return client
+
+        if _anthropic_cls is None:
             try:
                 from anthropic import Anthropic
-
-                if not settings.anthropic_api_key:
-                    raise ValueError("Anthropic API key not configured")
-                self._client = Anthropic(api_key=settings.anthropic_api_key)
             except ImportError:
                 raise ImportError("anthropic package not installed. Run: pip install anthropic")
-        return self._client
-
-    def _get_ollama_client(self):
-        """Get Ollama HTTP client."""
-        return httpx.Client(base_url=settings.ollama_base_url, timeout=60.0)
+            _anthropic_cls = Anthropic
+
+        if not settings.anthropic_api_key:
+            raise ValueError("Anthropic API key not configured")
+        with LLMService._clients_lock:
+            client = LLMService._clients.get(key)
+            if client is None:
+                client = _anthropic_cls(
+                    api_key=settings.anthropic_api_key, http_client=httpx.Client(limits=_HTTP_LIMITS)
+                )
+                LLMService._clients[key] = client
+        return client
+
+    def _get_ollama_client(self) -> httpx.Client:
+        """Get the shared Ollama HTTP client."""
+        key = ("ollama", settings.ollama_base_url)
+        client = LLMService._clients.get(key)
+        if client is None:
+            with LLMService._clients_lock:
+                client = LLMService._clients.get(key)
+                if client is None:
+                    client = httpx.Client(
+                        base_url=settings.ollama_base_url,
+                        timeout=httpx.Timeout(60.0, connect=5.0),
+                        transport=httpx.HTTPTransport(limits=_HTTP_LIMITS),
+                        headers={"Content-Type": "application/json"},
+                    )
+                    LLMService._clients[key] = client
+        return client
+
+    def _ollama_chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST a chat request to Ollama, retrying transient network failures with backoff."""
+        client = self._get_ollama_client()
+        body = orjson.dumps(payload)
+        for attempt in range(_OLLAMA_RETRIES):
+            try:
+                response = client.post("/api/chat", content=body)
+                break
+            except (httpx.ConnectError, httpx.ReadTimeout):
+                if attempt == _OLLAMA_RETRIES - 1:
+                    raise
+                time.sleep(min(0.5 * 2**attempt, 4.0))
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
     def generate_sql(
         self,
         user_prompt: str,
-        available_tables: List[Dict[str, Any]],
+        available_tables: Sequence[Union[TableMeta, Mapping[str, Any]]],
         sample_rows: Optional[List[Dict[str, Any]]] = None,
     ) -> Dict[str, Any]:
         """Generate SQL from natural language prompt using LLM."""
+        if _UNSAFE_PROMPT_RE.search(user_prompt):
+            raise RuntimeError("Prompt requests a data-modifying operation; only read-only queries are supported")
+
+        available_tables = [
+            table if isinstance(table, TableMeta) else TableMeta.from_mapping(table) for table in available_tables
+        ]
+
         if self.provider == "openai":
-            return self._generate_sql_openai(user_prompt, available_tables, sample_rows)
+            result = self._generate_sql_openai(user_prompt, available_tables, sample_rows)
         elif self.provider == "anthropic":
-            return self._generate_sql_anthropic(user_prompt, available_tables, sample_rows)
+            result = self._generate_sql_anthropic(user_prompt, available_tables, sample_rows)
         elif self.provider == "ollama":
-            return self._generate_sql_ollama(user_prompt, available_tables, sample_rows)
+            result = self._generate_sql_ollama(user_prompt, available_tables, sample_rows)
         else:
             raise ValueError(f"Unsupported LLM provider: {self.provider}")
 
+        if _UNSAFE_SQL_RE.search(result["sql"]):
+            raise RuntimeError("Generated SQL contains unsafe operations")
+        return result
+
     def _generate_sql_openai(
         self,
         user_prompt: str,
-        available_tables: List[Dict[str, Any]],
+        available_tables: List[TableMeta],
         sample_rows: Optional[List[Dict[str, Any]]] = None,
     ) -> Dict[str, Any]:
         """Generate SQL using OpenAI."""
         client = self._get_openai_client()
 
-        tables_context = self._format_tables_context(available_tables, sample_rows)
+        tables_context = self._format_tables_context(available_tables)
 
-        system_prompt = """You are a SQL expert specializing in eCommerce analytics. 
+        # Instructions and schema come first and stay byte-identical between calls so
+        # OpenAI's automatic prompt caching can reuse the prefix.
+        system_prompt = f"""You are a SQL expert specializing in eCommerce analytics. 
 Generate SQLite-compatible SQL queries from natural language questions.
 
 Rules:
@@ -85,12 +270,12 @@ Rules:
 - Use proper quoting for table/column names with special characters
 - Return ONLY the SQL query, no explanations unless asked
 - For aggregations, use appropriate GROUP BY clauses
-- Handle date filtering with proper date functions"""
+- Handle date filtering with proper date functions
 
-        user_message = f"""Available datasets:
-{tables_context}
+Available datasets:
+{tables_context}"""
 
-User question: {user_prompt}
+        user_message = f"""{self._format_sample_rows(sample_rows)}User question: {user_prompt}
 
 Generate a SQL query to answer this question. Return only the SQL, no markdown formatting."""
 
@@ -114,22 +299,22 @@ Generate a SQL query to answer this question. Return only the SQL, no markdown f
     def _generate_sql_anthropic(
         self,
         user_prompt: str,
-        available_tables: List[Dict[str, Any]],
+        available_tables: List[TableMeta],
         sample_rows: Optional[List[Dict[str, Any]]] = None,
     ) -> Dict[str, Any]:
         """Generate SQL using Anthropic Claude."""
         client = self._get_anthropic_client()
 
-        tables_context = self._format_tables_context(available_tables, sample_rows)
+        tables_context = self._format_tables_context(available_tables)
 
-        system_prompt = """You are a SQL expert specializing in eCommerce analytics. 
+        system_prompt = f"""You are a SQL expert specializing in eCommerce analytics. 
 Generate SQLite-compatible SQL queries from natural language questions.
-Return only the SQL query, no explanations."""
+Return only the SQL query, no explanations.
 
-        user_message = f"""Available datasets:
-{tables_context}
+Available datasets:
+{tables_context}"""
 
-User question: {user_prompt}
+        user_message = f"""{self._format_sample_rows(sample_rows)}User question: {user_prompt}
 
 Generate a SQL query to answer this question."""
 
@@ -137,7 +322,8 @@ Generate a SQL query to answer this question."""
             response = client.messages.create(
                 model="claude-3-5-sonnet-20241022",
                 max_tokens=500,
-                system=system_prompt,
+                # The schema block is stable across calls, so mark it for prompt caching
+                system=[{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}],
                 messages=[{"role": "user", "content": user_message}],
             )
             sql = response.content[0].text.strip()
@@ -150,28 +336,17 @@ Generate a SQL query to answer this question."""
     def _generate_sql_ollama(
         self,
         user_prompt: str,
-        available_tables: List[Dict[str, Any]],
+        available_tables: List[TableMeta],
         sample_rows: Optional[List[Dict[str, Any]]] = None,
     ) -> Dict[str, Any]:
         """Generate SQL using Ollama with explicit column validation."""
-        client = self._get_ollama_client()
-
         # Filter and limit tables to reduce prompt length
         relevant_tables = self._filter_relevant_tables(
             user_prompt, available_tables, max_tables=settings.ollama_max_tables
         )
         
         # Build explicit column list for validation
-        all_columns = {}
-        for table in available_tables:
-            table_name = table.get("table_name", "")
-            columns = table.get("columns", [])
-            if isinstance(columns, str):
-                try:
-                    columns = json.loads(columns)
-                except:
-                    columns = []
-            all_columns[table_name] = columns
+        all_columns = {table.table_name: table.columns for table in available_tables}
 
         tables_context = self._format_tables_context_compact(relevant_tables)
 
@@ -184,12 +359,12 @@ TABLES:
 Q: {user_prompt}
 SQL:"""
 
-        print(combined_prompt)  # Debug: print the final prompt sent to Ollama
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Ollama prompt: %s", combined_prompt)
 
         try:
-            response = client.post(
-                "/api/chat",
-                json={
+            result = self._ollama_chat(
+                {
                     "model": settings.ollama_model,
                     "messages": [
                         {"role": "user", "content": combined_prompt},
@@ -199,10 +374,8 @@ SQL:"""
                         "temperature": 0.1,
                         "num_predict": 500,
                     },
-                },
+                }
             )
-            response.raise_for_status()
-            result = response.json()
             sql = result["message"]["content"].strip()
             sql = self._clean_sql(sql)
 
@@ -217,35 +390,39 @@ SQL:"""
 
     def _validate_and_fix_sql_columns(self, sql: str, all_columns: Dict[str, List[str]]) -> str:
         """Validate SQL uses only existing columns and attempt to fix common issues."""
-        import re
-        
         # Extract table names from SQL
-        table_pattern = r'FROM\s+"?(\w+)"?|JOIN\s+"?(\w+)"?'
         tables_in_sql = set()
-        for match in re.finditer(table_pattern, sql, re.IGNORECASE):
+        for match in _SQL_TABLE_RE.finditer(sql):
             tables_in_sql.add(match.group(1) or match.group(2))
-        
-        # Check each table's columns
+
+        # Resolve referenced tables case-insensitively in a single pass over the schema
+        lower_key_map = {table.lower(): table for table in all_columns}
+        valid_columns = set()
         for table_name in tables_in_sql:
-            if table_name.lower() in [t.lower() for t in all_columns.keys()]:
-                # Find the actual table name (case-insensitive match)
-                actual_table = next((t for t in all_columns.keys() if t.lower() == table_name.lower()), None)
-                if actual_table:
-                    valid_columns = [col.lower() for col in all_columns[actual_table]]
-                    
-                    # Extract column references from SQL (simplified check)
-                    # This is a basic validation - could be enhanced
-                    column_pattern = r'\b(\w+)\s*(?:,|FROM|WHERE|GROUP|ORDER|HAVING|AS|=|>|<|>=|<=|!=)'
-                    sql_lower = sql.lower()
-                    
-                    # Note: This is a simplified check. Full SQL parsing would be more robust.
-                    # For now, we'll rely on the improved prompt and let SQL execution catch errors.
-        
+            actual_table = lower_key_map.get(table_name.lower())
+            if actual_table:
+                valid_columns.update(col.lower() for col in all_columns[actual_table])
+
+        if valid_columns:
+            # Quoted identifiers are the only references we can check without a full SQL parser;
+            # execution still catches anything this misses. Output aliases (and later references to
+            # them, e.g. in ORDER BY) are names the query defines itself, so they are not checked.
+            aliases = {alias.lower() for alias in _SQL_QUOTED_ALIAS_RE.findall(sql)}
+            unknown = {
+                identifier
+                for identifier in _SQL_QUOTED_IDENTIFIER_RE.findall(sql)
+                if identifier.lower() not in valid_columns
+                and identifier.lower() not in lower_key_map
+                and identifier.lower() not in aliases
+            }
+            if unknown:
+                logger.warning("Generated SQL references unknown columns: %s", ", ".join(sorted(unknown)))
+
         return sql
 
     def _filter_relevant_tables(
-        self, user_prompt: str, available_tables: List[Dict[str, Any]], max_tables: int = 8
-    ) -> List[Dict[str, Any]]:
+        self, user_prompt: str, available_tables: List[TableMeta], max_tables: int = 8
+    ) -> List[TableMeta]:
         """Filter tables based on relevance to user prompt."""
         prompt_lower = user_prompt.lower()
         prompt_words = set(prompt_lower.split())
@@ -253,17 +430,17 @@ SQL:"""
         scored_tables = []
         for table in available_tables:
             score = 0
-            table_name = table.get("table_name", "").lower()
-            business = table.get("business", "").lower()
-            category = table.get("category", "").lower()
-            dataset_name = table.get("dataset_name", "").lower()
+            table_name = table.table_name.lower()
+            business = table.business.lower()
+            category = table.category.lower()
+            dataset_name = table.dataset_name.lower()
             
             # Score based on keyword matches
             for word in prompt_words:
                 if len(word) > 3:  # Ignore short words
                     if word in table_name or word in business or word in category or word in dataset_name:
                         score += 2
-                    elif any(word in col.lower() for col in (table.get("columns", []) or [])):
+                    elif any(word in col.lower() for col in table.columns):
                         score += 1
             
             scored_tables.append((score, table))
@@ -278,18 +455,41 @@ SQL:"""
         
         return relevant if relevant else available_tables[:max_tables]
 
-    def _format_tables_context_compact(self, available_tables: List[Dict[str, Any]]) -> str:
+    def _schema_key(self, variant: str, available_tables: List[TableMeta], *extra: Any) -> str:
+        """Fingerprint the table metadata that feeds a formatted context string."""
+        payload = orjson.dumps(
+            [
+                variant,
+                [
+                    (t.table_name, t.business, t.category, t.columns)
+                    for t in available_tables
+                ],
+                extra,
+            ],
+            default=str,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+        )
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def _cache_context(self, key: str, context: str) -> str:
+        """Store a formatted context string, evicting the oldest entry when full."""
+        if len(self._context_cache) >= _CONTEXT_CACHE_SIZE:
+            self._context_cache.pop(next(iter(self._context_cache)))
+        self._context_cache[key] = context
+        return context
+
+    def _format_tables_context_compact(self, available_tables: List[TableMeta]) -> str:
         """Format table metadata in compact format for Ollama."""
+        schema_key = self._schema_key("compact", available_tables, settings.ollama_max_columns)
+        cached = self._context_cache.get(schema_key)
+        if cached is not None:
+            return cached
+
         context_parts = []
         for table in available_tables:
-            table_name = table.get("table_name", "")
-            columns = table.get("columns", [])
-            if isinstance(columns, str):
-                try:
-                    columns = json.loads(columns)
-                except:
-                    columns = []
-            
+            table_name = table.table_name
+            columns = table.columns
+
             # Compact format: table_name: col1, col2, col3...
             max_cols = settings.ollama_max_columns
             cols_str = ", ".join([f'"{col}"' for col in columns[:max_cols]])
@@ -298,32 +498,29 @@ SQL:"""
             
             context_parts.append(f'"{table_name}": {cols_str}')
 
-        return "\n".join(context_parts)
+        return self._cache_context(schema_key, "\n".join(context_parts))
 
-    def _format_tables_context(
-        self, available_tables: List[Dict[str, Any]], sample_rows: Optional[List[Dict[str, Any]]] = None
-    ) -> str:
+    def _format_tables_context(self, available_tables: List[TableMeta]) -> str:
         """Format table metadata for LLM context (used by OpenAI/Anthropic)."""
-        context_parts = []
-        for table in available_tables:
-            table_name = table.get("table_name", "")
-            business = table.get("business", "")
-            category = table.get("category", "")
-            columns = table.get("columns", [])
-            if isinstance(columns, str):
-                try:
-                    columns = json.loads(columns)
-                except:
-                    columns = []
+        schema_key = self._schema_key("full", available_tables)
+        cached = self._context_cache.get(schema_key)
+        if cached is not None:
+            return cached
 
-            context_parts.append(f"Table: {table_name}")
-            context_parts.append(f"  Business: {business}, Category: {category}")
-            context_parts.append(f"  Columns: {', '.join(columns)}")
+        context_parts = []
+        # Sort so the schema block, and therefore the cached prompt prefix, is deterministic
+        for table in sorted(available_tables, key=lambda t: t.table_name):
+            context_parts.append(f"Table: {table.table_name}")
+            context_parts.append(f"  Business: {table.business}, Category: {table.category}")
+            context_parts.append(f"  Columns: {', '.join(table.columns)}")
 
-            if sample_rows and len(sample_rows) > 0:
-                context_parts.append(f"  Sample data: {json.dumps(sample_rows[:2], default=str)}")
+        return self._cache_context(schema_key, "\n".join(context_parts))
 
-        return "\n".join(context_parts)
+    def _format_sample_rows(self, sample_rows: Optional[List[Dict[str, Any]]]) -> str:
+        """Format sample rows for the per-request part of the prompt."""
+        if not sample_rows:
+            return ""
+        return f"Sample data: {_dumps(sample_rows[:2])}\n\n"
 
     def _clean_sql(self, sql: str) -> str:
         """Remove markdown code blocks and extra whitespace from SQL."""
@@ -337,6 +534,14 @@ SQL:"""
             sql = sql[:-3].strip()
         return sql
 
+    def embed_text(self, text_value: str) -> List[float]:
+        """Embed text with the provider's embedding model (OpenAI only)."""
+        if self.provider != "openai":
+            raise ValueError(f"Embeddings not supported for LLM provider: {self.provider}")
+        client = self._get_openai_client()
+        response = client.embeddings.create(model=settings.openai_embedding_model, input=text_value)
+        return response.data[0].embedding
+
     def generate_insight_summary(self, signals: List[str], context: Dict[str, Any]) -> str:
         """Generate narrative summary from analytics signals."""
         if self.provider == "openai":
@@ -355,7 +560,7 @@ SQL:"""
         prompt = f"""Analyze these marketing analytics signals and provide a concise business insight summary:
 
 Signals: {', '.join(signals)}
-Context: {json.dumps(context, default=str)}
+Context: {_dumps(context)}
 
 Provide a 2-3 sentence summary highlighting key trends and actionable recommendations."""
 
@@ -377,7 +582,7 @@ Provide a 2-3 sentence summary highlighting key trends and actionable recommenda
         prompt = f"""Analyze these marketing analytics signals and provide a concise business insight summary:
 
 Signals: {', '.join(signals)}
-Context: {json.dumps(context, default=str)}"""
+Context: {_dumps(context)}"""
 
         try:
             response = client.messages.create(
@@ -391,19 +596,16 @@ Context: {json.dumps(context, default=str)}"""
 
     def _generate_summary_ollama(self, signals: List[str], context: Dict[str, Any]) -> str:
         """Generate insight summary using Ollama."""
-        client = self._get_ollama_client()
-
         prompt = f"""Analyze these marketing analytics signals and provide a concise business insight summary:
 
 Signals: {', '.join(signals)}
-Context: {json.dumps(context, default=str)}
+Context: {_dumps(context)}
 
 Provide a 2-3 sentence summary highlighting key trends and actionable recommendations."""
 
         try:
-            response = client.post(
-                "/api/chat",
-                json={
+            result = self._ollama_chat(
+                {
                     "model": settings.ollama_model,
                     "messages": [{"role": "user", "content": prompt}],
                     "stream": False,
@@ -411,10 +613,8 @@ Provide a 2-3 sentence summary highlighting key trends and actionable recommenda
                         "temperature": 0.7,
                         "num_predict": 300,
                     },
-                },
+                }
             )
-            response.raise_for_status()
-            result = response.json()
             return result["message"]["content"].strip()
         except Exception as e:
             return f"Summary generation failed: {str(e)}"
@@ -442,7 +642,7 @@ Provide a 2-3 sentence summary highlighting key trends and actionable recommenda
 
 Objectives: {', '.join(objectives)}
 Audience Segments: {', '.join(audience_segments)}
-Constraints: {json.dumps(constraints, default=str)}
+Constraints: {_dumps(constraints)}
 
 Return a JSON array of campaign objects, each with: name, channel, objective, expected_uplift (as percentage string), summary, talking_points (array).
 Format: [{{"name": "...", "channel": "...", "objective": "...", "expected_uplift": "...", "summary": "...", "talking_points": [...]}}]"""
@@ -455,7 +655,7 @@ Format: [{{"name": "...", "channel": "...", "objective": "...", "expected_uplift
                 response_format={"type": "json_object"},
             )
             content = response.choices[0].message.content.strip()
-            data = json.loads(content)
+            data = orjson.loads(content)
             return data.get("campaigns", []) if isinstance(data, dict) else data
         except Exception as e:
             return [{"error": f"Campaign generation failed: {str(e)}"}]
@@ -470,7 +670,7 @@ Format: [{{"name": "...", "channel": "...", "objective": "...", "expected_uplift
 
 Objectives: {', '.join(objectives)}
 Audience Segments: {', '.join(audience_segments)}
-Constraints: {json.dumps(constraints, default=str)}
+Constraints: {_dumps(constraints)}
 
 Each campaign should have: name, channel, objective, expected_uplift, summary, talking_points."""
 
@@ -481,7 +681,7 @@ Each campaign should have: name, channel, objective, expected_uplift, summary, t
                 messages=[{"role": "user", "content": prompt}],
             )
             content = response.content[0].text.strip()
-            data = json.loads(content)
+            data = orjson.loads(content)
             return data if isinstance(data, list) else [data]
         except Exception as e:
             return [{"error": f"Campaign generation failed: {str(e)}"}]
@@ -490,21 +690,18 @@ Each campaign should have: name, channel, objective, expected_uplift, summary, t
         self, objectives: List[str], audience_segments: List[str], constraints: Dict[str, Any]
     ) -> List[Dict[str, Any]]:
         """Generate campaign recommendations using Ollama."""
-        client = self._get_ollama_client()
-
         prompt = f"""Generate 3-5 marketing campaign recommendations as JSON array based on:
 
 Objectives: {', '.join(objectives)}
 Audience Segments: {', '.join(audience_segments)}
-Constraints: {json.dumps(constraints, default=str)}
+Constraints: {_dumps(constraints)}
 
 Return a JSON array of campaign objects, each with: name, channel, objective, expected_uplift (as percentage string), summary, talking_points (array).
 Format: [{{"name": "...", "channel": "...", "objective": "...", "expected_uplift": "...", "summary": "...", "talking_points": [...]}}]"""
 
         try:
-            response = client.post(
-                "/api/chat",
-                json={
+            result = self._ollama_chat(
+                {
                     "model": settings.ollama_model,
                     "messages": [{"role": "user", "content": prompt}],
                     "stream": False,
@@ -512,10 +709,8 @@ Format: [{{"name": "...", "channel": "...", "objective": "...", "expected_uplift
                         "temperature": 0.8,
                         "num_predict": 1000,
                     },
-                },
+                }
             )
-            response.raise_for_status()
-            result = response.json()
             content = result["message"]["content"].strip()
             # Try to extract JSON from markdown code blocks if present
             if "```json" in content:
@@ -523,9 +718,9 @@ Format: [{{"name": "...", "channel": "...", "objective": "...", "expected_uplift
             elif "```" in content:
                 content = content.split("```")[1].split("```")[0].strip()
 
-            data = json.loads(content)
+            data = orjson.loads(content)
             return data if isinstance(data, list) else [data]
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             raw_content = result.get("message", {}).get("content", "") if "result" in locals() else content if "content" in locals() else ""
             return [{"error": f"Failed to parse JSON response: {str(e)}", "raw": raw_content}]
         except Exception as e:
@@ -549,7 +744,7 @@ Format: [{{"name": "...", "channel": "...", "objective": "...", "expected_uplift
         prompt = f"""Generate 3-5 marketing experiment plans based on current metrics and performance:
 
 Metrics to optimize: {', '.join(metrics)}
-Context: {json.dumps(context, default=str)}
+Context: {_dumps(context)}
 
 Return a JSON object with a "experiments" array. Each experiment should have:
 - name: Short experiment name
@@ -568,7 +763,7 @@ Format: {{"experiments": [{{"name": "...", "hypothesis": "...", "primary_metric"
                 response_format={"type": "json_object"},
             )
             content = response.choices[0].message.content.strip()
-            data = json.loads(content)
+            data = orjson.loads(content)
             return data.get("experiments", []) if isinstance(data, dict) else data
         except Exception as e:
             return [{"error": f"Experiment generation failed: {str(e)}"}]
@@ -580,7 +775,7 @@ Format: {{"experiments": [{{"name": "...", "hypothesis": "...", "primary_metric"
         prompt = f"""Generate 3-5 marketing experiment plans as JSON array:
 
 Metrics to optimize: {', '.join(metrics)}
-Context: {json.dumps(context, default=str)}
+Context: {_dumps(context)}
 
 Each experiment should have: name, hypothesis, primary_metric, status (draft/testing/complete), eta."""
 
@@ -591,26 +786,23 @@ Each experiment should have: name, hypothesis, primary_metric, status (draft/tes
                 messages=[{"role": "user", "content": prompt}],
             )
             content = response.content[0].text.strip()
-            data = json.loads(content)
+            data = orjson.loads(content)
             return data if isinstance(data, list) else [data]
         except Exception as e:
             return [{"error": f"Experiment generation failed: {str(e)}"}]
 
     def _generate_experiments_ollama(self, metrics: List[str], context: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Generate experiment plans using Ollama."""
-        client = self._get_ollama_client()
-
         prompt = f"""Generate 3-5 marketing experiment plans as JSON array:
 
 Metrics to optimize: {', '.join(metrics)}
-Context: {json.dumps(context, default=str)}
+Context: {_dumps(context)}
 
 Return JSON array with: name, hypothesis, primary_metric, status (draft/testing/complete), eta."""
 
         try:
-            response = client.post(
-                "/api/chat",
-                json={
+            result = self._ollama_chat(
+                {
                     "model": settings.ollama_model,
                     "messages": [{"role": "user", "content": prompt}],
                     "stream": False,
@@ -618,19 +810,17 @@ Return JSON array with: name, hypothesis, primary_metric, status (draft/testing/
                         "temperature": 0.8,
                         "num_predict": 1000,
                     },
-                },
+                }
             )
-            response.raise_for_status()
-            result = response.json()
             content = result["message"]["content"].strip()
             if "```json" in content:
                 content = content.split("```json")[1].split("```")[0].strip()
             elif "```" in content:
                 content = content.split("```")[1].split("```")[0].strip()
 
-            data = json.loads(content)
+            data = orjson.loads(content)
             return data if isinstance(data, list) else [data]
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             return [{"error": f"Failed to parse JSON response: {str(e)}"}]
         except Exception as e:
             return [{"error": f"Experiment generation failed: {str(e)}"}]
@@ -3,9 +3,12 @@ from __future__ import annotations
 
 import json
 import re
-from difflib import get_close_matches
-from typing import Dict, List, Optional, Sequence
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Sequence, Tuple
 
+from rapidfuzz import fuzz, process
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 
@@ -13,13 +16,73 @@ from ..core.config import settings
 from ..db.session import engine
 from ..workflows.local_csv_ingestion import DATASET_REGISTRY_TABLE
 from .analytics_service import AnalyticsService
-from .llm_service import LLMService
+from .llm_service import _UNSAFE_SQL_RE, LLMService
+from .semantic_cache import SemanticSqlCache, prompt_literals
+
+
+_REGISTRY_TTL_SECONDS = 60.0
+# Registry rows and first-table sample rows per engine, with the monotonic time they were loaded; keyed by
+# the engine object because separate databases can share a URL string (in-memory SQLite, masked passwords)
+_RegistryEntry = Tuple[float, List[Dict[str, str]], List[Dict[str, object]]]
+_REGISTRY_CACHE: "weakref.WeakKeyDictionary[Engine, _RegistryEntry]" = weakref.WeakKeyDictionary()
+_REGISTRY_LOCK = threading.Lock()
+# Live semantic caches, emptied with the registry cache so ingests never serve stale rows
+_SEMANTIC_CACHES: "weakref.WeakSet[SemanticSqlCache]" = weakref.WeakSet()
+
+
+def _substring_pattern(terms: Sequence[str]) -> re.Pattern[str]:
+    """Compile terms into one alternation that matches any of them as a plain substring."""
+    return re.compile("|".join(re.escape(term) for term in terms))
+
+
+_KPI_KEYWORD_PATTERNS: Dict[str, re.Pattern[str]] = {
+    metric: _substring_pattern(keywords)
+    for metric, keywords in {
+        "revenue": ["revenue", "total revenue", "total sales", "sales"],
+        "aov": ["aov", "average order value"],
+        "roas": ["roas", "return on ad spend"],
+        "conversion_rate": ["conversion rate", "cr", "conversions"],
+        "sessions": ["sessions", "traffic", "visits"],
+    }.items()
+}
+# Prompts asking for a breakdown need real SQL rather than a single KPI value
+_KPI_DISQUALIFIER_RE = _substring_pattern(
+    [
+        " group",
+        " grouped",
+        " by ",
+        " per ",
+        " breakdown",
+        " each ",
+        " vs ",
+        " over ",
+        " trend",
+        " split",
+        " segment",
+        " cohort",
+        " channel",
+    ]
+)
+_KPI_SUMMARY_CUE_RE = _substring_pattern(["total", "overall", "kpi", "overview", "dashboard", "summary", "aggregate"])
 
 
 def _normalize(text_value: str) -> str:
     return text_value.lower().replace("_", " ")
 
 
+def _dataset_match_text(dataset: Dict[str, object]) -> str:
+    return _normalize(f"{dataset['business']} {dataset['dataset_name']} {dataset['table_name']}")
+
+
+def clear_registry_cache() -> None:
+    """Drop cached registry rows and prompt results so the next prompt sees newly ingested datasets."""
+    with _REGISTRY_LOCK:
+        _REGISTRY_CACHE.clear()
+        semantic_caches = list(_SEMANTIC_CACHES)
+    for semantic_cache in semantic_caches:
+        semantic_cache.clear()
+
+
 class PromptToSqlService:
     """Generate SQL statements from natural language prompts using LLM or heuristics."""
 
@@ -47,38 +110,69 @@ class PromptToSqlService:
             if not self.llm_service:
                 self.use_llm = False
 
+        self.semantic_cache = self._build_semantic_cache()
+
+    def _build_semantic_cache(self) -> Optional[SemanticSqlCache]:
+        """Create the prompt result cache when enabled and backed by a real embedding model."""
+        if not (self.use_llm and self.llm_service and settings.enable_semantic_cache):
+            return None
+        # Lexical fallback embeddings are too coarse to key cached rows on; even model embeddings need
+        # the literal check in SemanticSqlCache.lookup to tell apart prompts differing in a year or shop
+        if self.llm_service.provider != "openai" or not settings.openai_api_key:
+            return None
+        semantic_cache = SemanticSqlCache(
+            embed=self.llm_service.embed_text,
+            threshold=settings.semantic_cache_threshold,
+            ttl_seconds=settings.semantic_cache_ttl_seconds,
+        )
+        with _REGISTRY_LOCK:
+            _SEMANTIC_CACHES.add(semantic_cache)
+        return semantic_cache
+
     def _load_registry(self) -> List[Dict[str, str]]:
+        return self._load_registry_with_samples()[0]
+
+    def _load_registry_with_samples(self) -> Tuple[List[Dict[str, str]], List[Dict[str, object]]]:
+        """Return registry rows and sample rows, served from a short-lived cache shared by all instances."""
+        with _REGISTRY_LOCK:
+            cached = _REGISTRY_CACHE.get(self.engine)
+        if cached is not None and time.monotonic() - cached[0] < _REGISTRY_TTL_SECONDS:
+            return cached[1], cached[2]
+
+        rows, sample_rows = self._fetch_registry()
+        with _REGISTRY_LOCK:
+            _REGISTRY_CACHE[self.engine] = (time.monotonic(), rows, sample_rows)
+        return rows, sample_rows
+
+    def _fetch_registry(self) -> Tuple[List[Dict[str, str]], List[Dict[str, object]]]:
+        """Load the registry and sample rows of its first table over a single connection."""
         query = text(
-            f"SELECT table_name, business, category, dataset_name, columns FROM {DATASET_REGISTRY_TABLE}"
+            f"SELECT table_name, business, category, dataset_name, columns FROM {DATASET_REGISTRY_TABLE} "
+            "ORDER BY table_name"
         )
-        with self.engine.begin() as connection:
+        sample_rows: List[Dict[str, object]] = []
+        with self.engine.connect() as connection:
             result = connection.execute(query)
             rows = [dict(row._mapping) for row in result]
+            if rows:
+                try:
+                    sample_query = text(f'SELECT * FROM "{rows[0]["table_name"]}" LIMIT 3')
+                    sample_rows = [dict(row._mapping) for row in connection.execute(sample_query)]
+                except Exception:
+                    pass
+        # JSONB columns arrive decoded from the Postgres driver; SQLite (and legacy TEXT columns) need parsing
         for row in rows:
             if isinstance(row["columns"], str):
                 row["columns"] = json.loads(row["columns"])
-        return rows
+            # Precompute the dataset selection key once per cache fill rather than on every prompt
+            row["_match_text"] = _dataset_match_text(row)
+        return rows, sample_rows
 
     def _select_dataset(self, prompt: str, datasets: Sequence[Dict[str, str]]) -> Dict[str, str]:
-        prompt_norm = _normalize(prompt)
-
-        scores = []
-        for dataset in datasets:
-            candidates = [
-                dataset["table_name"],
-                dataset["dataset_name"],
-                f"{dataset['business']} {dataset['dataset_name']}",
-            ]
-            normalized_candidates = [_normalize(candidate) for candidate in candidates]
-            best = get_close_matches(prompt_norm, normalized_candidates, n=1, cutoff=0)
-            score = 0.0
-            if best:
-                match = best[0]
-                score = len(set(match.split()).intersection(prompt_norm.split())) / max(len(prompt_norm.split()), 1)
-            scores.append((score, dataset))
-
-        scores.sort(key=lambda item: item[0], reverse=True)
-        return scores[0][1] if scores else datasets[0]
+        # Score the prompt against every dataset in one vectorized C++ pass
+        candidates = [dataset.get("_match_text") or _dataset_match_text(dataset) for dataset in datasets]
+        scores = process.cdist([_normalize(prompt)], candidates, scorer=fuzz.token_set_ratio)[0]
+        return datasets[int(scores.argmax())]
 
     def _build_query(self, dataset: Dict[str, str]) -> str:
         table_name = dataset["table_name"]
@@ -98,31 +192,46 @@ class PromptToSqlService:
         return f"SELECT * FROM {quoted_table}{order_clause} LIMIT 50;"
 
     def execute_prompt(self, prompt: str) -> Dict[str, object]:
-        datasets = self._load_registry()
-        if not datasets:
-            raise ValueError("No datasets have been ingested yet.")
-
+        # KPI prompts are answered by the analytics service alone, so skip the registry round trip
         kpi_metrics = self._detect_kpi_metrics(prompt)
         if kpi_metrics:
             return self._execute_kpi_prompt(kpi_metrics)
 
+        datasets, sample_rows = self._load_registry_with_samples()
+        if not datasets:
+            raise ValueError("No datasets have been ingested yet.")
+
         if self.use_llm and self.llm_service:
-            return self._execute_prompt_llm(prompt, datasets)
+            return self._execute_prompt_llm_cached(prompt, datasets, sample_rows)
         else:
             return self._execute_prompt_heuristic(prompt, datasets)
 
-    def _execute_prompt_llm(self, prompt: str, datasets: List[Dict[str, str]]) -> Dict[str, object]:
-        """Execute prompt using LLM for SQL generation."""
-        sample_rows = []
+    def _execute_prompt_llm_cached(
+        self, prompt: str, datasets: List[Dict[str, str]], sample_rows: List[Dict[str, object]]
+    ) -> Dict[str, object]:
+        """Serve paraphrases of recent prompts from the semantic cache before calling the LLM."""
+        if not self.semantic_cache:
+            return self._execute_prompt_llm(prompt, datasets, sample_rows)
+
         try:
-            first_table = datasets[0]
-            sample_query = text(f'SELECT * FROM "{first_table["table_name"]}" LIMIT 3')
-            with self.engine.begin() as connection:
-                result = connection.execute(sample_query)
-                sample_rows = [dict(row._mapping) for row in result]
+            embedding = self.semantic_cache.embed(prompt)
         except Exception:
-            pass
+            # The cache is an optimization; an embedding outage must not fail the prompt
+            return self._execute_prompt_llm(prompt, datasets, sample_rows)
 
+        literals = prompt_literals(prompt)
+        cached = self.semantic_cache.lookup(embedding, literals)
+        if cached is not None:
+            return cached
+
+        response = self._execute_prompt_llm(prompt, datasets, sample_rows)
+        self.semantic_cache.store(embedding, literals, response)
+        return response
+
+    def _execute_prompt_llm(
+        self, prompt: str, datasets: List[Dict[str, str]], sample_rows: List[Dict[str, object]]
+    ) -> Dict[str, object]:
+        """Execute prompt using LLM for SQL generation."""
         # Pass sample_rows to help Ollama understand data structure better
         llm_result = self.llm_service.generate_sql(prompt, datasets, sample_rows)
         sql = llm_result["sql"]
@@ -184,46 +293,19 @@ class PromptToSqlService:
     def _detect_kpi_metrics(self, prompt: str) -> List[str]:
         """Detect KPI metrics referenced in the prompt."""
         prompt_lower = prompt.lower()
-        keyword_map = {
-            "revenue": ["revenue", "total revenue", "total sales", "sales"],
-            "aov": ["aov", "average order value"],
-            "roas": ["roas", "return on ad spend"],
-            "conversion_rate": ["conversion rate", "cr", "conversions"],
-            "sessions": ["sessions", "traffic", "visits"],
-        }
 
-        detected: List[str] = []
-        for metric, keywords in keyword_map.items():
-            if any(keyword in prompt_lower for keyword in keywords):
-                detected.append(metric)
+        detected = [metric for metric, pattern in _KPI_KEYWORD_PATTERNS.items() if pattern.search(prompt_lower)]
 
         if "kpi" in prompt_lower or "all metrics" in prompt_lower:
-            detected = ["revenue", "aov", "roas", "conversion_rate", "sessions"]
+            detected = list(_KPI_KEYWORD_PATTERNS)
 
         if not detected:
             return []
 
-        disqualifiers = [
-            " group",
-            " grouped",
-            " by ",
-            " per ",
-            " breakdown",
-            " each ",
-            " vs ",
-            " over ",
-            " trend",
-            " split",
-            " segment",
-            " cohort",
-            " channel",
-        ]
-        if any(term in prompt_lower for term in disqualifiers):
+        if _KPI_DISQUALIFIER_RE.search(prompt_lower):
             return []
 
-        summary_cues = ["total", "overall", "kpi", "overview", "dashboard", "summary", "aggregate"]
-        words = prompt_lower.split()
-        if not any(cue in prompt_lower for cue in summary_cues) and len(words) > 8:
+        if not _KPI_SUMMARY_CUE_RE.search(prompt_lower) and len(prompt_lower.split()) > 8:
             return []
 
         return detected
@@ -247,9 +329,7 @@ class PromptToSqlService:
 
     def _is_safe_sql(self, sql: str) -> bool:
         """Check if SQL contains only safe operations."""
-        dangerous_keywords = ["DROP", "DELETE", "INSERT", "UPDATE", "ALTER", "TRUNCATE", "CREATE", "EXEC"]
-        sql_upper = sql.upper()
-        return not any(keyword in sql_upper for keyword in dangerous_keywords)
+        return _UNSAFE_SQL_RE.search(sql) is None
 
     def _extract_table_from_sql(self, sql: str, datasets: List[Dict[str, str]]) -> Dict[str, str]:
         """Extract table name from SQL query."""
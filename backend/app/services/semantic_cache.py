@@ -0,0 +1,112 @@
+"""Semantic response cache for prompt-to-SQL results keyed by prompt embeddings."""
+from __future__ import annotations
+
+import re
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence
+
+import numpy as np
+
+# Quoted strings, numbers, and capitalized or identifier-like words (shop_a, Q3) after the first word
+_QUOTED_RE = re.compile(r"'([^']*)'|\"([^\"]*)\"")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_WORD_RE = re.compile(r"\w+")
+
+
+def prompt_literals(prompt: str) -> FrozenSet[str]:
+    """Return the literal values in a prompt: numbers, quoted strings and proper-noun-like tokens.
+
+    Embeddings rate prompts that differ only in such values (a year, a shop name) as near-duplicates,
+    so a cache hit additionally requires them to match exactly.
+    """
+    literals = {single or double for single, double in _QUOTED_RE.findall(prompt)}
+    literals.update(_NUMBER_RE.findall(prompt))
+    for word in _WORD_RE.findall(_QUOTED_RE.sub(" ", prompt))[1:]:
+        if word[0].isupper() or "_" in word or any(char.isdigit() for char in word):
+            literals.add(word)
+    return frozenset(literals)
+
+
+class SemanticSqlCache:
+    """In-memory cache returning stored prompt responses for sufficiently similar prompts."""
+
+    def __init__(
+        self,
+        embed: Callable[[str], Sequence[float]],
+        threshold: float = 0.9,
+        ttl_seconds: float = 300.0,
+        max_entries: int = 256,
+    ) -> None:
+        self._embed = embed
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._embeddings: Optional[np.ndarray] = None
+        self._timestamps: List[float] = []
+        self._literals: List[FrozenSet[str]] = []
+        self._responses: List[Dict[str, object]] = []
+
+    def embed(self, prompt: str) -> np.ndarray:
+        """Return the L2-normalized embedding for a prompt."""
+        vector = np.asarray(self._embed(prompt), dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding: np.ndarray, literals: FrozenSet[str]) -> Optional[Dict[str, object]]:
+        """Return the closest cached response that clears the similarity threshold and has the same literals."""
+        with self._lock:
+            self._evict_expired()
+            if self._embeddings is None or not self._responses:
+                return None
+            similarities = self._embeddings @ embedding
+            for index in np.argsort(similarities)[::-1]:
+                if similarities[index] < self.threshold:
+                    return None
+                if self._literals[index] == literals:
+                    return dict(self._responses[index])
+            return None
+
+    def store(self, embedding: np.ndarray, literals: FrozenSet[str], response: Dict[str, object]) -> None:
+        with self._lock:
+            self._evict_expired()
+            row = embedding.reshape(1, -1)
+            if self._embeddings is None or self._embeddings.shape[1] != row.shape[1]:
+                self._embeddings = row
+                self._timestamps = []
+                self._literals = []
+                self._responses = []
+            else:
+                self._embeddings = np.vstack([self._embeddings, row])
+            self._timestamps.append(time.monotonic())
+            self._literals.append(literals)
+            self._responses.append(dict(response))
+
+            overflow = len(self._responses) - self.max_entries
+            if overflow > 0:
+                self._drop_oldest(overflow)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._embeddings = None
+            self._timestamps = []
+            self._literals = []
+            self._responses = []
+
+    def _evict_expired(self) -> None:
+        # Entries are appended in time order, so expired ones are always a prefix
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = 0
+        for timestamp in self._timestamps:
+            if timestamp >= cutoff:
+                break
+            expired += 1
+        if expired:
+            self._drop_oldest(expired)
+
+    def _drop_oldest(self, count: int) -> None:
+        self._timestamps = self._timestamps[count:]
+        self._literals = self._literals[count:]
+        self._responses = self._responses[count:]
+        self._embeddings = self._embeddings[count:] if self._responses else None
@@ -1,22 +1,75 @@
 """Workflow for processing Klaviyo campaign data and analyzing images."""
 from __future__ import annotations
 
+import asyncio
 import json
+import os
 import re
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
+import orjson
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 
+from ..core.async_utils import run_async
 from ..core.config import settings
 from ..db.session import engine
 from ..services.analytics_service import AnalyticsService
 from ..services.image_analysis_service import ImageAnalysisService
 from ..services.prompt_sql_service import PromptToSqlService
 
+_INSERT_CAMPAIGN_ANALYSIS = text("""
+    INSERT INTO campaign_analysis 
+    (experiment_run_id, campaign_id, campaign_name, sql_query, query_results, metrics)
+    VALUES (:experiment_run_id, :campaign_id, :campaign_name, :sql_query, :query_results, :metrics)
+""")
+_INSERT_IMAGE_ANALYSIS = text("""
+    INSERT INTO image_analysis_results
+    (experiment_run_id, campaign_id, image_id, image_path, visual_elements, 
+     dominant_colors, composition_analysis, text_content, overall_description, marketing_relevance)
+    VALUES (:experiment_run_id, :campaign_id, :image_id, :image_path, :visual_elements,
+            :dominant_colors, :composition_analysis, :text_content, :overall_description, :marketing_relevance)
+""")
+_INSERT_CORRELATION = text("""
+    INSERT INTO visual_element_correlations
+    (experiment_run_id, element_type, element_description, average_performance,
+     performance_impact, recommendation, campaign_count)
+    VALUES (:experiment_run_id, :element_type, :element_description, :average_performance,
+            :performance_impact, :recommendation, :campaign_count)
+""")
+_INSERT_EXPERIMENT_RUN = text("""
+    INSERT INTO experiment_runs
+    (experiment_run_id, name, description, sql_query, status, config, results_summary, completed_at)
+    VALUES (:experiment_run_id, :name, :description, :sql_query, :status, :config, :results_summary, :completed_at)
+""")
+
+_IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png"})
+
+# Maximum number of vision API calls in flight at once
+_IMAGE_ANALYSIS_CONCURRENCY = 8
+# Maximum number of element-type correlation calls run in parallel
+_CORRELATION_WORKERS = 8
+
+# Pattern: www.klaviyo.com_campaign_01K4QVNYM1QKSK61X7PXR019DF_web-view.png
+# Or: campaign_01K4QVNYM1QKSK61X7PXR019DF.jpg
+_CAMPAIGN_ID_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE)
+    for pattern in (
+        r"campaign_([A-Z0-9]+)",  # campaign_01K4QVNYM1QKSK61X7PXR019DF
+        r"_campaign_([A-Z0-9]+)",  # _campaign_01K4QVNYM1QKSK61X7PXR019DF
+        r"([A-Z0-9]{26,})",  # Generic long ID (Klaviyo IDs are typically 26 chars)
+    )
+]
+
+
+def _dumps(value: Any) -> str:
+    """Serialize a row payload to JSON text, stringifying values orjson can't encode (e.g. Decimal)."""
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
 
 def _ensure_tables(db_engine: Engine) -> None:
     """Ensure all required tables exist."""
@@ -36,22 +89,38 @@ def _ensure_tables(db_engine: Engine) -> None:
 
 def _extract_campaign_id_from_filename(filename: str) -> Optional[str]:
     """Extract campaign ID from image filename."""
-    # Pattern: www.klaviyo.com_campaign_01K4QVNYM1QKSK61X7PXR019DF_web-view.png
-    # Or: campaign_01K4QVNYM1QKSK61X7PXR019DF.jpg
-    patterns = [
-        r"campaign_([A-Z0-9]+)",  # campaign_01K4QVNYM1QKSK61X7PXR019DF
-        r"_campaign_([A-Z0-9]+)",  # _campaign_01K4QVNYM1QKSK61X7PXR019DF
-        r"([A-Z0-9]{26,})",  # Generic long ID (Klaviyo IDs are typically 26 chars)
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, filename, re.IGNORECASE)
+    for pattern in _CAMPAIGN_ID_PATTERNS:
+        match = pattern.search(filename)
         if match:
             return match.group(1)
     
     return None
 
 
+async def _analyze_images(
+    image_analysis_service: ImageAnalysisService,
+    image_files: List[Path],
+    campaign_ids: List[Optional[str]],
+) -> List[Optional[Dict[str, Any]]]:
+    """Analyze images concurrently, returning None for any image that failed."""
+    semaphore = asyncio.Semaphore(_IMAGE_ANALYSIS_CONCURRENCY)
+
+    async def analyze(image_file: Path, campaign_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            try:
+                return await image_analysis_service.analyze_image_async(
+                    image_path=image_file,
+                    campaign_id=campaign_id,
+                    campaign_name=None,
+                    analysis_type="full",
+                )
+            except Exception as e:
+                print(f"Failed to analyze image {image_file}: {str(e)}")
+                return None
+
+    return await asyncio.gather(*(analyze(f, cid) for f, cid in zip(image_files, campaign_ids)))
+
+
 def run_campaign_strategy_experiment(
     sql_query: Optional[str] = None,
     prompt_query: Optional[str] = None,
@@ -124,6 +193,7 @@ def run_campaign_strategy_experiment(
     # Store campaign analysis results
     campaign_ids = []
     products_promoted = []
+    campaign_params = []
     
     for row in rows:
         campaign_id = row.get("campaign_id") or row.get("id")
@@ -143,68 +213,74 @@ def run_campaign_strategy_experiment(
             if isinstance(products, list):
                 products_promoted.extend(products)
         
-        # Store campaign analysis
-        with work_engine.begin() as connection:
-            connection.execute(
-                text("""
-                    INSERT INTO campaign_analysis 
-                    (experiment_run_id, campaign_id, campaign_name, sql_query, query_results, metrics)
-                    VALUES (:experiment_run_id, :campaign_id, :campaign_name, :sql_query, :query_results, :metrics)
-                """),
-                {
-                    "experiment_run_id": experiment_run_id,
-                    "campaign_id": str(campaign_id) if campaign_id else None,
-                    "campaign_name": campaign_name,
-                    "sql_query": sql_query,
-                    "query_results": json.dumps(row),
-                    "metrics": json.dumps({
-                        "open_rate": row.get("open_rate"),
-                        "click_rate": row.get("click_rate"),
-                        "conversion_rate": row.get("conversion_rate"),
-                        "revenue": row.get("revenue"),
-                    }),
-                }
-            )
+        campaign_params.append({
+            "experiment_run_id": experiment_run_id,
+            "campaign_id": str(campaign_id) if campaign_id else None,
+            "campaign_name": campaign_name,
+            "sql_query": sql_query,
+            "query_results": _dumps(row),
+            "metrics": _dumps({
+                "open_rate": row.get("open_rate"),
+                "click_rate": row.get("click_rate"),
+                "conversion_rate": row.get("conversion_rate"),
+                "revenue": row.get("revenue"),
+            }),
+        })
+    
+    # Store campaign analysis in one executemany round trip
+    with work_engine.begin() as connection:
+        connection.execute(_INSERT_CAMPAIGN_ANALYSIS, campaign_params)
     
     # Step 2: Analyze images for these campaigns
     image_analyses = []
     visual_elements_list = []
+    image_params = []
     
     if image_directory:
         image_dir = Path(image_directory)
         if image_dir.exists():
             # Find images matching campaign IDs
-            image_files = list(image_dir.glob("*.jpg")) + list(image_dir.glob("*.png")) + list(image_dir.glob("*.jpeg"))
+            image_files = sorted(
+                Path(entry.path)
+                for entry in os.scandir(image_dir)
+                if os.path.splitext(entry.name)[1].lower() in _IMAGE_EXTENSIONS and entry.is_file()
+            )
             
+            # Uppercased ID -> original ID, keeping the first campaign for duplicates
+            campaign_id_lookup: Dict[str, str] = {}
+            for cid in campaign_ids:
+                campaign_id_lookup.setdefault(cid.upper(), cid)
+            
+            matched_campaign_ids = []
             for image_file in image_files:
                 campaign_id_from_file = _extract_campaign_id_from_filename(image_file.name)
                 
                 # Match image to campaign if ID found
                 matched_campaign_id = None
                 if campaign_id_from_file:
+                    file_id = campaign_id_from_file.upper()
                     # Try exact match first
-                    if campaign_id_from_file in campaign_ids:
-                        matched_campaign_id = campaign_id_from_file
-                    else:
+                    matched_campaign_id = campaign_id_lookup.get(file_id)
+                    if matched_campaign_id is None:
                         # Try partial match
-                        for cid in campaign_ids:
-                            if campaign_id_from_file in str(cid) or str(cid) in campaign_id_from_file:
+                        for upper_cid, cid in campaign_id_lookup.items():
+                            if file_id in upper_cid or upper_cid in file_id:
                                 matched_campaign_id = cid
                                 break
+                matched_campaign_ids.append(matched_campaign_id)
+            
+            # Analyze all images concurrently; results line up with image_files
+            analysis_results = run_async(
+                _analyze_images(image_analysis_service, image_files, matched_campaign_ids)
+            )
+            
+            for image_file, matched_campaign_id, analysis_result in zip(
+                image_files, matched_campaign_ids, analysis_results
+            ):
+                if analysis_result is None:
+                    continue
                 
-                # Analyze image
                 try:
-                    with open(image_file, "rb") as f:
-                        import base64
-                        image_data = base64.b64encode(f.read()).decode("utf-8")
-                    
-                    analysis_result = image_analysis_service.analyze_image(
-                        image_base64=image_data,
-                        campaign_id=matched_campaign_id,
-                        campaign_name=None,
-                        analysis_type="full",
-                    )
-                    
                     image_analyses.append(analysis_result)
                     
                     # Extract visual elements for correlation
@@ -215,34 +291,29 @@ def run_campaign_strategy_experiment(
                             "campaign_id": matched_campaign_id,
                         })
                     
-                    # Store image analysis result
-                    with work_engine.begin() as connection:
-                        connection.execute(
-                            text("""
-                                INSERT INTO image_analysis_results
-                                (experiment_run_id, campaign_id, image_id, image_path, visual_elements, 
-                                 dominant_colors, composition_analysis, text_content, overall_description, marketing_relevance)
-                                VALUES (:experiment_run_id, :campaign_id, :image_id, :image_path, :visual_elements,
-                                        :dominant_colors, :composition_analysis, :text_content, :overall_description, :marketing_relevance)
-                            """),
-                            {
-                                "experiment_run_id": experiment_run_id,
-                                "campaign_id": matched_campaign_id,
-                                "image_id": analysis_result.get("image_id"),
-                                "image_path": str(image_file),
-                                "visual_elements": json.dumps(analysis_result.get("visual_elements", [])),
-                                "dominant_colors": json.dumps(analysis_result.get("dominant_colors", [])),
-                                "composition_analysis": analysis_result.get("composition_analysis"),
-                                "text_content": analysis_result.get("text_content"),
-                                "overall_description": analysis_result.get("overall_description"),
-                                "marketing_relevance": analysis_result.get("marketing_relevance"),
-                            }
-                        )
+                    image_params.append({
+                        "experiment_run_id": experiment_run_id,
+                        "campaign_id": matched_campaign_id,
+                        "image_id": analysis_result.get("image_id"),
+                        "image_path": str(image_file),
+                        "visual_elements": _dumps(analysis_result.get("visual_elements", [])),
+                        "dominant_colors": _dumps(analysis_result.get("dominant_colors", [])),
+                        "composition_analysis": analysis_result.get("composition_analysis"),
+                        "text_content": analysis_result.get("text_content"),
+                        "overall_description": analysis_result.get("overall_description"),
+                        "marketing_relevance": analysis_result.get("marketing_relevance"),
+                    })
                 except Exception as e:
-                    print(f"Failed to analyze image {image_file}: {str(e)}")
+                    print(f"Failed to process analysis for image {image_file}: {str(e)}")
                     continue
     
+    # Store image analysis results in one executemany round trip
+    if image_params:
+        with work_engine.begin() as connection:
+            connection.execute(_INSERT_IMAGE_ANALYSIS, image_params)
+    
     # Step 3: Cross-index visual elements with performance
+    correlation_params = []
     if visual_elements_list:
         # Group elements by type
         element_types = {}
@@ -252,57 +323,54 @@ def run_campaign_strategy_experiment(
                 element_types[elem_type] = []
             element_types[elem_type].append(elem)
         
-        # Correlate with performance
-        for elem_type, elements in element_types.items():
+        # Correlate with performance; each element type is an independent LLM call, so run them in parallel
+        with ThreadPoolExecutor(max_workers=min(_CORRELATION_WORKERS, len(element_types))) as executor:
+            futures = {
+                executor.submit(
+                    image_analysis_service.correlate_visual_elements_with_performance,
+                    [elem["description"] for elem in elements],
+                    None,
+                    1,
+                ): (elem_type, elements)
+                for elem_type, elements in element_types.items()
+            }
+            completed = list(as_completed(futures))
+        
+        for future in completed:
+            elem_type, elements = futures[future]
             try:
-                correlation_result = image_analysis_service.correlate_visual_elements_with_performance(
-                    visual_elements=[elem["description"] for elem in elements],
-                    date_range=None,
-                    min_campaigns=1,
-                )
+                correlation_result = future.result()
                 
                 for corr in correlation_result.get("correlations", []):
-                    with work_engine.begin() as connection:
-                        connection.execute(
-                            text("""
-                                INSERT INTO visual_element_correlations
-                                (experiment_run_id, element_type, element_description, average_performance,
-                                 performance_impact, recommendation, campaign_count)
-                                VALUES (:experiment_run_id, :element_type, :element_description, :average_performance,
-                                        :performance_impact, :recommendation, :campaign_count)
-                            """),
-                            {
-                                "experiment_run_id": experiment_run_id,
-                                "element_type": corr.get("element_type", elem_type),
-                                "element_description": corr.get("element_description", ""),
-                                "average_performance": json.dumps(corr.get("average_performance", {})),
-                                "performance_impact": corr.get("performance_impact", ""),
-                                "recommendation": corr.get("recommendation", ""),
-                                "campaign_count": len(elements),
-                            }
-                        )
+                    correlation_params.append({
+                        "experiment_run_id": experiment_run_id,
+                        "element_type": corr.get("element_type", elem_type),
+                        "element_description": corr.get("element_description", ""),
+                        "average_performance": _dumps(corr.get("average_performance", {})),
+                        "performance_impact": corr.get("performance_impact", ""),
+                        "recommendation": corr.get("recommendation", ""),
+                        "campaign_count": len(elements),
+                    })
             except Exception as e:
                 print(f"Failed to correlate element type {elem_type}: {str(e)}")
     
-    # Store experiment run
+    # Store correlations and the experiment run in a single transaction
     with work_engine.begin() as connection:
+        if correlation_params:
+            connection.execute(_INSERT_CORRELATION, correlation_params)
         connection.execute(
-            text("""
-                INSERT INTO experiment_runs
-                (experiment_run_id, name, description, sql_query, status, config, results_summary, completed_at)
-                VALUES (:experiment_run_id, :name, :description, :sql_query, :status, :config, :results_summary, :completed_at)
-            """),
+            _INSERT_EXPERIMENT_RUN,
             {
                 "experiment_run_id": experiment_run_id,
                 "name": experiment_name or f"Campaign Strategy Analysis {experiment_run_id[:8]}",
                 "description": f"Analyzed {len(rows)} campaigns, {len(image_analyses)} images",
                 "sql_query": sql_query,
                 "status": "completed",
-                "config": json.dumps({
+                "config": _dumps({
                     "prompt_query": prompt_query,
                     "image_directory": image_directory,
                 }),
-                "results_summary": json.dumps({
+                "results_summary": _dumps({
                     "campaigns_analyzed": len(rows),
                     "images_analyzed": len(image_analyses),
                     "visual_elements_found": len(visual_elements_list),
@@ -2,79 +2,187 @@
 from __future__ import annotations
 
 import json
-import re
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-from sqlalchemy import text
-from sqlalchemy.engine import Engine
+from sqlalchemy import column, table, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection, Engine
 
 from ..core.config import settings
 from ..db.session import engine
+from .local_csv_ingestion import (
+    IngestedDataset,
+    _ensure_registry,
+    _normalize_identifier,
+    _record_dataset,
+    _run_ddl_once,
+)
 
 
-def _normalize_identifier(raw: str) -> str:
-    """Normalize column names to valid SQL identifiers."""
-    cleaned = re.sub(r"[^\w\s-]", " ", raw).lower()
-    cleaned = re.sub(r"[\s-]+", "_", cleaned).strip("_")
-    return cleaned or "column"
+_COUNT_COLUMNS = (
+    "sent_count",
+    "delivered_count",
+    "bounced_count",
+    "opened_count",
+    "clicked_count",
+    "converted_count",
+    "unsubscribed_count",
+    "spam_count",
+)
+_RATE_COLUMNS = ("open_rate", "click_rate", "conversion_rate")
+# Identifier and text columns are read as strings so IDs like "00123" are not coerced to numbers
+_TEXT_COLUMNS = ("campaign_id", "campaign_name", "subject", "sent_at")
+
+# Columns written on conflict; created_at keeps the value from the original insert
+_UPSERT_COLUMNS = (
+    "campaign_name",
+    "subject",
+    "sent_at",
+    *_COUNT_COLUMNS,
+    "revenue",
+    *_RATE_COLUMNS,
+    "products",
+    "updated_at",
+)
+_CAMPAIGNS_TABLE = table("campaigns", *(column(name) for name in ("campaign_id", *_UPSERT_COLUMNS, "created_at")))
+
+
+# Common Klaviyo column name variations
+_COLUMN_VARIATIONS = {
+    "campaign_id": ["campaign id", "campaign_id", "id", "campaign identifier"],
+    "campaign_name": ["campaign name", "campaign_name", "name", "campaign"],
+    "subject": ["subject", "email subject", "subject line"],
+    "sent_at": ["sent at", "sent_at", "date sent", "send date", "created at", "send time"],
+    "sent_count": ["sent", "sent count", "sent_count", "emails sent", "total sent", "total recipients"],
+    "delivered_count": ["delivered", "delivered count", "delivered_count", "emails delivered", "successful deliveries"],
+    "bounced_count": ["bounced", "bounced count", "bounced_count", "bounces"],
+    "opened_count": ["opened", "opened count", "opened_count", "opens", "unique opens"],
+    "clicked_count": ["clicked", "clicked count", "clicked_count", "clicks", "unique clicks"],
+    "converted_count": ["converted", "converted count", "converted_count", "conversions", "purchases", "unique placed order"],
+    "revenue": ["revenue", "total revenue", "revenue generated", "sales"],
+    "open_rate": ["open rate", "open_rate", "open %", "open percentage"],
+    "click_rate": ["click rate", "click_rate", "click %", "click percentage", "ctr"],
+    "conversion_rate": ["conversion rate", "conversion_rate", "conversion %", "conversion percentage", "placed order rate"],
+    "unsubscribed_count": ["unsubscribed", "unsubscribed count", "unsubscribed_count", "unsubscribes"],
+    "spam_count": ["spam", "spam count", "spam_count", "spam reports", "spam complaints"],
+}
+_VARIATION_TO_STANDARD: Dict[str, str] = {
+    variation: standard_name for standard_name, variations in _COLUMN_VARIATIONS.items() for variation in variations
+}
+# Rate columns and the count they are derived from when the export omits the rate
+_RATE_SOURCES = (
+    ("open_rate", "opened_count"),
+    ("click_rate", "clicked_count"),
+    ("conversion_rate", "converted_count"),
+)
+
+
+def _pct_to_float(values: pd.Series) -> pd.Series:
+    """Parse rate values, scaling percentage strings (e.g. "40.34%" -> 0.4034) and passing decimals through."""
+    raw = values.astype("string").str.strip()
+    has_pct = raw.str.endswith("%").fillna(False)
+    numbers = pd.to_numeric(raw.str.rstrip("%"), errors="coerce").astype("float64")
+    return numbers.where(~has_pct, numbers / 100.0)
 
 
 def _normalize_klaviyo_columns(df: pd.DataFrame) -> pd.DataFrame:
     """Normalize Klaviyo CSV columns to standard names."""
+    # The first CSV column matching a standard name claims it; later matches keep their original name
     column_mapping = {}
-    
-    # Common Klaviyo column name variations
-    mappings = {
-        "campaign_id": ["campaign id", "campaign_id", "id", "campaign identifier", "campaign id"],
-        "campaign_name": ["campaign name", "campaign_name", "name", "campaign"],
-        "subject": ["subject", "email subject", "subject line"],
-        "sent_at": ["sent at", "sent_at", "date sent", "send date", "created at", "send time"],
-        "sent_count": ["sent", "sent count", "sent_count", "emails sent", "total sent", "total recipients", "successful deliveries"],
-        "delivered_count": ["delivered", "delivered count", "delivered_count", "emails delivered", "successful deliveries"],
-        "bounced_count": ["bounced", "bounced count", "bounced_count", "bounces"],
-        "opened_count": ["opened", "opened count", "opened_count", "opens", "unique opens", "unique opens"],
-        "clicked_count": ["clicked", "clicked count", "clicked_count", "clicks", "unique clicks", "unique clicks"],
-        "converted_count": ["converted", "converted count", "converted_count", "conversions", "purchases", "unique placed order"],
-        "revenue": ["revenue", "total revenue", "revenue generated", "sales"],
-        "open_rate": ["open rate", "open_rate", "open %", "open percentage"],
-        "click_rate": ["click rate", "click_rate", "click %", "click percentage", "ctr"],
-        "conversion_rate": ["conversion rate", "conversion_rate", "conversion %", "conversion percentage", "placed order rate"],
-        "unsubscribed_count": ["unsubscribed", "unsubscribed count", "unsubscribed_count", "unsubscribes"],
-        "spam_count": ["spam", "spam count", "spam_count", "spam reports", "spam complaints"],
-    }
-    
-    df_columns_lower = {col.lower(): col for col in df.columns}
-    
-    for standard_name, variations in mappings.items():
-        for variation in variations:
-            if variation.lower() in df_columns_lower:
-                column_mapping[df_columns_lower[variation.lower()]] = standard_name
-                break
+    claimed = set()
+    for original in df.columns:
+        standard_name = _VARIATION_TO_STANDARD.get(str(original).lower())
+        if standard_name and standard_name not in claimed:
+            column_mapping[original] = standard_name
+            claimed.add(standard_name)
     
     # Rename columns
     df = df.rename(columns=column_mapping)
     
-    # Calculate rates if not present
-    if "open_rate" not in df.columns and "opened_count" in df.columns and "sent_count" in df.columns:
-        df["open_rate"] = df["opened_count"] / df["sent_count"].replace(0, 1)
-    elif "open_rate" in df.columns:
-        # Convert percentage strings to decimals (e.g., "40.34%" -> 0.4034)
-        df["open_rate"] = df["open_rate"].apply(lambda x: float(str(x).replace("%", "")) / 100 if pd.notna(x) and "%" in str(x) else (float(x) if pd.notna(x) else None))
+    for rate_column, count_column in _RATE_SOURCES:
+        if rate_column not in df.columns and count_column in df.columns and "sent_count" in df.columns:
+            # Calculate rates if not present
+            df[rate_column] = df[count_column] / df["sent_count"].replace(0, 1)
+        elif rate_column in df.columns:
+            # Convert percentage strings to decimals (e.g., "40.34%" -> 0.4034)
+            df[rate_column] = _pct_to_float(df[rate_column])
     
-    if "click_rate" not in df.columns and "clicked_count" in df.columns and "sent_count" in df.columns:
-        df["click_rate"] = df["clicked_count"] / df["sent_count"].replace(0, 1)
-    elif "click_rate" in df.columns:
-        df["click_rate"] = df["click_rate"].apply(lambda x: float(str(x).replace("%", "")) / 100 if pd.notna(x) and "%" in str(x) else (float(x) if pd.notna(x) else None))
+    return df
+
+
+def _campaign_id_from_name(campaign_name: str) -> str:
+    return _normalize_identifier(campaign_name, fallback="column")
+
+
+def _text_column(df: pd.DataFrame, name: str) -> pd.Series:
+    """Return a stripped string column with blank cells treated as missing."""
+    if name not in df.columns:
+        return pd.Series(pd.NA, index=df.index, dtype="string")
+    values = df[name].astype("string").str.strip()
+    return values.mask(values == "")
+
+
+def _numeric_column(df: pd.DataFrame, name: str) -> pd.Series:
+    if name not in df.columns:
+        return pd.Series(float("nan"), index=df.index)
+    return pd.to_numeric(df[name], errors="coerce")
+
+
+def _products_json(values: pd.Series) -> pd.Series:
+    """JSON-encode product cells, serializing each distinct value once and leaving missing cells as None."""
+    codes, uniques = pd.factorize(values)
+    # Missing cells get code -1, which picks the trailing None
+    encoded = np.array([json.dumps(value) for value in uniques] + [None], dtype=object)
+    return pd.Series(encoded[codes], index=values.index, dtype=object)
+
+
+def _build_campaign_records(df: pd.DataFrame, now: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Convert a normalized Klaviyo frame into campaign rows, reporting rows that have no usable ID."""
+    campaign_name = _text_column(df, "campaign_name")
+    campaign_id = _text_column(df, "campaign_id")
+    # Fall back to an identifier derived from the campaign name when the ID is blank
+    campaign_id = campaign_id.where(campaign_id.notna(), campaign_name.map(_campaign_id_from_name, na_action="ignore"))
     
-    if "conversion_rate" not in df.columns and "converted_count" in df.columns and "sent_count" in df.columns:
-        df["conversion_rate"] = df["converted_count"] / df["sent_count"].replace(0, 1)
-    elif "conversion_rate" in df.columns:
-        df["conversion_rate"] = df["conversion_rate"].apply(lambda x: float(str(x).replace("%", "")) / 100 if pd.notna(x) and "%" in str(x) else (float(x) if pd.notna(x) else None))
+    missing = campaign_id.isna()
+    errors = [f"Row {position + 1}: Missing campaign_id and campaign_name" for position in missing.to_numpy().nonzero()[0]]
     
-    return df
+    frame = pd.DataFrame(
+        {
+            "campaign_id": campaign_id,
+            "campaign_name": campaign_name,
+            "subject": _text_column(df, "subject"),
+            "sent_at": _text_column(df, "sent_at"),
+        },
+        index=df.index,
+    )
+    for name in _COUNT_COLUMNS:
+        frame[name] = _numeric_column(df, name).fillna(0).astype("int64")
+    frame["revenue"] = _numeric_column(df, "revenue").fillna(0.0)
+    for name in _RATE_COLUMNS:
+        frame[name] = _numeric_column(df, name)
+    frame["products"] = _products_json(df["products"]) if "products" in df.columns else None
+    frame["created_at"] = now
+    frame["updated_at"] = now
+    
+    # Bind missing values as NULL rather than NaN
+    frame = frame[~missing].astype(object)
+    return frame.where(frame.notna(), None).to_dict("records"), errors
+
+
+def _upsert_campaigns(connection: Connection, records: List[Dict[str, Any]]) -> int:
+    """Upsert campaign rows in one executemany and return how many were newly inserted."""
+    insert = postgresql_insert if connection.dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(_CAMPAIGNS_TABLE)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["campaign_id"],
+        set_={name: stmt.excluded[name] for name in _UPSERT_COLUMNS},
+    ).returning((_CAMPAIGNS_TABLE.c.created_at == _CAMPAIGNS_TABLE.c.updated_at).label("was_insert"))
+    return sum(1 for (was_insert,) in connection.execute(stmt, records) if was_insert)
 
 
 def _ensure_campaigns_table(db_engine: Engine) -> None:
@@ -105,16 +213,16 @@ def _ensure_campaigns_table(db_engine: Engine) -> None:
         )
     """)
     
-    with db_engine.begin() as connection:
+    def create(connection: Connection) -> None:
         connection.execute(create_stmt)
         
-        # Create index for faster queries
-        try:
-            connection.execute(text("CREATE INDEX IF NOT EXISTS idx_campaigns_campaign_id ON campaigns(campaign_id)"))
-            connection.execute(text("CREATE INDEX IF NOT EXISTS idx_campaigns_sent_at ON campaigns(sent_at)"))
-            connection.execute(text("CREATE INDEX IF NOT EXISTS idx_campaigns_conversion_rate ON campaigns(conversion_rate)"))
-        except:
-            pass  # Indexes might already exist
+        # Create index for faster queries; IF NOT EXISTS already covers re-runs, so failures are real errors
+        connection.execute(text("CREATE INDEX IF NOT EXISTS idx_campaigns_campaign_id ON campaigns(campaign_id)"))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS idx_campaigns_sent_at ON campaigns(sent_at)"))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS idx_campaigns_conversion_rate ON campaigns(conversion_rate)"))
+    
+    # DDL runs once per engine per process; later ingests skip straight to the upsert
+    _run_ddl_once(db_engine, "campaigns", create)
 
 
 def ingest_klaviyo_csv(
@@ -140,113 +248,27 @@ def ingest_klaviyo_csv(
         raise FileNotFoundError(f"CSV file not found: {csv_file_path}")
     
     # Load and normalize CSV
-    df = pd.read_csv(csv_path)
+    header = pd.read_csv(csv_path, nrows=0).columns
+    text_dtypes = {name: "string" for name in header if _VARIATION_TO_STANDARD.get(str(name).lower()) in _TEXT_COLUMNS}
+    df = pd.read_csv(csv_path, engine="c", memory_map=True, dtype=text_dtypes)
     df = _normalize_klaviyo_columns(df)
     
     # Ensure campaigns table exists
     _ensure_campaigns_table(work_engine)
     
-    # Prepare data for insertion
     now = datetime.utcnow().isoformat()
-    inserted_count = 0
-    updated_count = 0
-    errors = []
+    records, errors = _build_campaign_records(df, now)
     
-    with work_engine.begin() as connection:
-        for _, row in df.iterrows():
-            try:
-                # Extract campaign_id (required)
-                campaign_id = str(row.get("campaign_id", "")).strip()
-                if not campaign_id:
-                    # Try to generate from campaign_name if available
-                    campaign_name = str(row.get("campaign_name", "")).strip()
-                    if campaign_name:
-                        campaign_id = _normalize_identifier(campaign_name)
-                    else:
-                        errors.append(f"Row {len(errors) + 1}: Missing campaign_id and campaign_name")
-                        continue
-                
-                # Prepare data
-                campaign_data = {
-                    "campaign_id": campaign_id,
-                    "campaign_name": str(row.get("campaign_name", "")).strip() or None,
-                    "subject": str(row.get("subject", "")).strip() or None,
-                    "sent_at": str(row.get("sent_at", "")).strip() or None,
-                    "sent_count": int(row.get("sent_count", 0)) if pd.notna(row.get("sent_count")) else 0,
-                    "delivered_count": int(row.get("delivered_count", 0)) if pd.notna(row.get("delivered_count")) else 0,
-                    "bounced_count": int(row.get("bounced_count", 0)) if pd.notna(row.get("bounced_count")) else 0,
-                    "opened_count": int(row.get("opened_count", 0)) if pd.notna(row.get("opened_count")) else 0,
-                    "clicked_count": int(row.get("clicked_count", 0)) if pd.notna(row.get("clicked_count")) else 0,
-                    "converted_count": int(row.get("converted_count", 0)) if pd.notna(row.get("converted_count")) else 0,
-                    "revenue": float(row.get("revenue", 0.0)) if pd.notna(row.get("revenue")) else 0.0,
-                    "open_rate": float(row.get("open_rate", 0.0)) if pd.notna(row.get("open_rate")) else None,
-                    "click_rate": float(row.get("click_rate", 0.0)) if pd.notna(row.get("click_rate")) else None,
-                    "conversion_rate": float(row.get("conversion_rate", 0.0)) if pd.notna(row.get("conversion_rate")) else None,
-                    "unsubscribed_count": int(row.get("unsubscribed_count", 0)) if pd.notna(row.get("unsubscribed_count")) else 0,
-                    "spam_count": int(row.get("spam_count", 0)) if pd.notna(row.get("spam_count")) else 0,
-                    "products": json.dumps(row.get("products", [])) if "products" in row and pd.notna(row.get("products")) else None,
-                    "created_at": now,
-                    "updated_at": now,
-                }
-                
-                # Check if campaign exists
-                check_query = text("SELECT campaign_id FROM campaigns WHERE campaign_id = :campaign_id")
-                existing = connection.execute(check_query, {"campaign_id": campaign_id}).fetchone()
-                
-                if existing:
-                    # Update existing campaign
-                    update_query = text("""
-                        UPDATE campaigns SET
-                            campaign_name = :campaign_name,
-                            subject = :subject,
-                            sent_at = :sent_at,
-                            sent_count = :sent_count,
-                            delivered_count = :delivered_count,
-                            bounced_count = :bounced_count,
-                            opened_count = :opened_count,
-                            clicked_count = :clicked_count,
-                            converted_count = :converted_count,
-                            revenue = :revenue,
-                            open_rate = :open_rate,
-                            click_rate = :click_rate,
-                            conversion_rate = :conversion_rate,
-                            unsubscribed_count = :unsubscribed_count,
-                            spam_count = :spam_count,
-                            products = :products,
-                            updated_at = :updated_at
-                        WHERE campaign_id = :campaign_id
-                    """)
-                    connection.execute(update_query, campaign_data)
-                    updated_count += 1
-                else:
-                    # Insert new campaign
-                    insert_query = text("""
-                        INSERT INTO campaigns (
-                            campaign_id, campaign_name, subject, sent_at,
-                            sent_count, delivered_count, bounced_count,
-                            opened_count, clicked_count, converted_count,
-                            revenue, open_rate, click_rate, conversion_rate,
-                            unsubscribed_count, spam_count, products,
-                            created_at, updated_at
-                        ) VALUES (
-                            :campaign_id, :campaign_name, :subject, :sent_at,
-                            :sent_count, :delivered_count, :bounced_count,
-                            :opened_count, :clicked_count, :converted_count,
-                            :revenue, :open_rate, :click_rate, :conversion_rate,
-                            :unsubscribed_count, :spam_count, :products,
-                            :created_at, :updated_at
-                        )
-                    """)
-                    connection.execute(insert_query, campaign_data)
-                    inserted_count += 1
-                    
-            except Exception as e:
-                errors.append(f"Row {len(errors) + inserted_count + updated_count + 1}: {str(e)}")
-                continue
+    # Last row wins for IDs repeated within the file; a batch may not touch the same row twice
+    unique_records = list({record["campaign_id"]: record for record in records}.values())
+    inserted_count = 0
+    if unique_records:
+        with work_engine.begin() as connection:
+            inserted_count = _upsert_campaigns(connection, unique_records)
+    # Repeated IDs count as updates of the row inserted by their first occurrence
+    updated_count = len(records) - inserted_count
     
     # Also register in dataset registry for prompt-to-SQL discovery
-    from ..workflows.local_csv_ingestion import _ensure_registry, _record_dataset, IngestedDataset
-    
     _ensure_registry(work_engine)
     dataset = IngestedDataset(
         table_name=table_name,
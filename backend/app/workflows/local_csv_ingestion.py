@@ -2,20 +2,42 @@
 from __future__ import annotations
 
 import json
+import multiprocessing
+import os
 import re
+import threading
+import weakref
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+import numpy as np
+import orjson
 import pandas as pd
 from sqlalchemy import text
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Connection, Engine
 
 from ..core.config import settings
 from ..db.session import engine
 
 DATASET_REGISTRY_TABLE = "dataset_registry"
+# Rows bound per executemany batch, bounding the parameter buffers built for large CSVs
+_TO_SQL_CHUNKSIZE = 10_000
+# Text columns with fewer distinct values than this share of rows are stored as categoricals
+_CATEGORICAL_MAX_UNIQUE_RATIO = 0.05
+_CATEGORICAL_MIN_ROWS = 1_000
+# Uploads larger than this are parsed and written in row chunks rather than materialized whole
+_CSV_STREAM_MIN_BYTES = 256 * 1024 * 1024
+_CSV_STREAM_CHUNK_ROWS = 200_000
+# Directories smaller than this are parsed serially; below it worker start-up costs more than it saves
+_PARALLEL_PARSE_MIN_BYTES = 64 * 1024 * 1024
+
+# Tables whose CREATE statements already ran, per engine; keyed by the engine object because
+# separate in-memory SQLite engines share one URL
+_DDL_DONE: "weakref.WeakKeyDictionary[Engine, Set[str]]" = weakref.WeakKeyDictionary()
+_DDL_LOCK = threading.Lock()
 
 
 @dataclass
@@ -29,13 +51,23 @@ class IngestedDataset:
     columns: List[str]
 
 
-def _normalize_identifier(raw: str) -> str:
-    cleaned = re.sub(r"[^\w\s-]", " ", raw).lower()
-    cleaned = re.sub(r"[\s-]+", "_", cleaned).strip("_")
-    return cleaned or "dataset"
+_NON_WORD_RE = re.compile(r"[^\w\s-]")
+_SEPARATOR_RE = re.compile(r"[\s-]+")
+
+
+def _normalize_identifier(raw: str, fallback: str = "dataset") -> str:
+    cleaned = _NON_WORD_RE.sub(" ", raw).lower()
+    cleaned = _SEPARATOR_RE.sub("_", cleaned).strip("_")
+    return cleaned or fallback
+
+
+def _uses_jsonb(engine: Engine) -> bool:
+    # Postgres stores registry columns as JSONB so the driver hands back decoded lists
+    return engine.dialect.name == "postgresql"
 
 
 def _ensure_registry(engine: Engine) -> None:
+    columns_type = "JSONB" if _uses_jsonb(engine) else "TEXT"
     create_stmt = text(
         f"""
         CREATE TABLE IF NOT EXISTS {DATASET_REGISTRY_TABLE} (
@@ -45,26 +77,50 @@ def _ensure_registry(engine: Engine) -> None:
             dataset_name TEXT NOT NULL,
             source_file TEXT NOT NULL,
             row_count INTEGER NOT NULL,
-            columns TEXT NOT NULL,
+            columns {columns_type} NOT NULL,
             ingested_at TEXT NOT NULL
         )
         """
     )
-    with engine.begin() as connection:
-        connection.execute(create_stmt)
+    _run_ddl_once(engine, DATASET_REGISTRY_TABLE, lambda connection: connection.execute(create_stmt))
+
+
+def _run_ddl_once(engine: Engine, table_name: str, create: Callable[[Connection], object]) -> None:
+    """Run a table's idempotent DDL in a transaction the first time it is requested for this engine."""
+    with _DDL_LOCK:
+        done = _DDL_DONE.setdefault(engine, set())
+        if table_name in done:
+            return
+        with engine.begin() as connection:
+            create(connection)
+        done.add(table_name)
 
 
 def _record_dataset(engine: Engine, dataset: IngestedDataset) -> None:
-    payload = {
-        "table_name": dataset.table_name,
-        "business": dataset.business,
-        "category": dataset.category,
-        "dataset_name": dataset.dataset_name,
-        "source_file": dataset.source_file,
-        "row_count": dataset.row_count,
-        "columns": json.dumps(dataset.columns),
-        "ingested_at": datetime.utcnow().isoformat(),
-    }
+    _record_datasets(engine, [dataset])
+
+
+def _record_datasets(engine: Engine, datasets: List[IngestedDataset]) -> None:
+    """Upsert registry rows for a batch of datasets in one executemany, sharing one ingestion timestamp."""
+    if not datasets:
+        return
+
+    ingested_at = datetime.utcnow().isoformat()
+    payloads = [
+        {
+            "table_name": dataset.table_name,
+            "business": dataset.business,
+            "category": dataset.category,
+            "dataset_name": dataset.dataset_name,
+            "source_file": dataset.source_file,
+            "row_count": dataset.row_count,
+            "columns": orjson.dumps(dataset.columns).decode(),
+            "ingested_at": ingested_at,
+        }
+        for dataset in datasets
+    ]
+
+    columns_param = "CAST(:columns AS JSONB)" if _uses_jsonb(engine) else ":columns"
 
     with engine.begin() as connection:
         connection.execute(
@@ -75,7 +131,7 @@ def _record_dataset(engine: Engine, dataset: IngestedDataset) -> None:
                     source_file, row_count, columns, ingested_at
                 ) VALUES (
                     :table_name, :business, :category, :dataset_name,
-                    :source_file, :row_count, :columns, :ingested_at
+                    :source_file, :row_count, {columns_param}, :ingested_at
                 )
                 ON CONFLICT(table_name) DO UPDATE SET
                     business=excluded.business,
@@ -87,16 +143,189 @@ def _record_dataset(engine: Engine, dataset: IngestedDataset) -> None:
                     ingested_at=excluded.ingested_at
                 """
             ),
-            payload,
+            payloads,
         )
 
+    # Imported lazily: the prompt service imports this module at load time
+    from ..services.prompt_sql_service import clear_registry_cache
+
+    clear_registry_cache()
+
 
 def _load_csv(file_path: Path) -> pd.DataFrame:
-    df = pd.read_csv(file_path)
+    # Map the file instead of streaming it through Python file reads; the C parser tokenizes straight from it
+    df = pd.read_csv(file_path, engine="c", memory_map=True)
     df.columns = [_normalize_identifier(col) for col in df.columns]
     return df
 
 
+def _chunk_dtypes(first_chunk: pd.DataFrame) -> Dict[str, object]:
+    """Dtypes pinning the first chunk's text columns for the remaining chunks of a streamed CSV.
+
+    Only text is pinned, so a later chunk of numeric-looking codes stays text. Numeric columns keep
+    per-chunk inference, which widens to float or text as the whole-file path would, instead of failing
+    on a blank or a decimal after the first chunk.
+    """
+    return {
+        name: dtype
+        for name, dtype in first_chunk.dtypes.items()
+        if (pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype))
+        and first_chunk[name].notna().any()
+    }
+
+
+def _iter_csv(file_path: Path) -> Iterator[pd.DataFrame]:
+    """Yield the CSV as normalized frames, reading large files in chunks to bound peak memory."""
+    if file_path.stat().st_size < _CSV_STREAM_MIN_BYTES:
+        yield _load_csv(file_path)
+        return
+
+    first_chunk = pd.read_csv(file_path, engine="c", memory_map=True, nrows=_CSV_STREAM_CHUNK_ROWS)
+    dtypes = _chunk_dtypes(first_chunk)
+    first_chunk.columns = [_normalize_identifier(col) for col in first_chunk.columns]
+    yield first_chunk
+    if len(first_chunk) < _CSV_STREAM_CHUNK_ROWS:
+        return
+
+    with pd.read_csv(
+        file_path,
+        engine="c",
+        memory_map=True,
+        skiprows=range(1, _CSV_STREAM_CHUNK_ROWS + 1),
+        dtype=dtypes,
+        chunksize=_CSV_STREAM_CHUNK_ROWS,
+    ) as reader:
+        for chunk in reader:
+            chunk.columns = [_normalize_identifier(col) for col in chunk.columns]
+            yield chunk
+
+
+def _constant_column(length: int, value: str) -> pd.Categorical:
+    # One shared category instead of `length` copies of the same string
+    return pd.Categorical.from_codes(np.zeros(length, dtype=np.int8), categories=[value])
+
+
+def _categorical_columns(df: pd.DataFrame) -> List[str]:
+    """Text columns repetitive enough to store as categoricals."""
+    if len(df) < _CATEGORICAL_MIN_ROWS:
+        return []
+    return [
+        name
+        for name in df.select_dtypes(include=["object", "string"]).columns
+        if df[name].nunique() / len(df) < _CATEGORICAL_MAX_UNIQUE_RATIO
+    ]
+
+
+def _tag_provenance(
+    df: pd.DataFrame,
+    business_name: str,
+    category_slug: str,
+    csv_file: Path,
+    categorical_columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """Add the provenance columns, storing repetitive text as categoricals to keep frames small in transit."""
+    if categorical_columns is None:
+        categorical_columns = _categorical_columns(df)
+    for name in categorical_columns:
+        df[name] = df[name].astype("category")
+    df["business_name"] = _constant_column(len(df), business_name)
+    df["category"] = _constant_column(len(df), category_slug)
+    df["source_file"] = _constant_column(len(df), str(csv_file))
+    return df
+
+
+def _tag_chunks(
+    frames: Iterable[pd.DataFrame], business_name: str, category_slug: str, csv_file: Path
+) -> Iterator[pd.DataFrame]:
+    """Tag every chunk of one file, converting the categorical columns chosen from its first chunk."""
+    categorical_columns: Optional[List[str]] = None
+    for df in frames:
+        if categorical_columns is None:
+            categorical_columns = _categorical_columns(df)
+        yield _tag_provenance(df, business_name, category_slug, csv_file, categorical_columns)
+
+
+def _write_table(engine: Engine, table_name: str, frames: Iterable[pd.DataFrame]) -> Tuple[int, List[str]]:
+    """Replace a warehouse table with the frames' rows in a single transaction.
+
+    Returns the number of rows written and the columns of the first frame.
+    """
+    row_count = 0
+    columns: List[str] = []
+    with engine.connect() as connection:
+        sqlite = connection.dialect.name == "sqlite"
+        if sqlite:
+            # Skip fsyncs and keep temp b-trees in memory for the duration of the bulk load only
+            previous_synchronous = connection.exec_driver_sql("PRAGMA synchronous").scalar()
+            connection.exec_driver_sql("PRAGMA synchronous=OFF")
+            connection.exec_driver_sql("PRAGMA temp_store=MEMORY")
+            connection.commit()
+        try:
+            with connection.begin():
+                for df in frames:
+                    # Plain executemany is batched by the drivers; method="multi" is far slower on SQLite
+                    df.to_sql(
+                        table_name,
+                        connection,
+                        if_exists="append" if columns else "replace",
+                        index=False,
+                        chunksize=_TO_SQL_CHUNKSIZE,
+                    )
+                    columns = columns or list(df.columns)
+                    row_count += len(df)
+        finally:
+            if sqlite:
+                connection.exec_driver_sql(f"PRAGMA synchronous={int(previous_synchronous)}")
+                connection.exec_driver_sql("PRAGMA temp_store=DEFAULT")
+                connection.commit()
+    return row_count, columns
+
+
+def _load_dataset_frame(job: Tuple[str, str, str, Path]) -> pd.DataFrame:
+    """Parse one (table_name, business_name, category_slug, csv_file) job's CSV; runs in worker processes."""
+    _, business_name, category_slug, csv_file = job
+    return _tag_provenance(_load_csv(csv_file), business_name, category_slug, csv_file)
+
+
+def _iter_dataset_frames(
+    jobs: List[Tuple[str, str, str, Path]]
+) -> Iterator[Tuple[Tuple[str, str, str, Path], pd.DataFrame]]:
+    """Yield each job with its parsed frame, using a bounded process pool for large directories.
+
+    At most one parsed frame per worker waits for the writer, so memory stays proportional to the pool
+    size rather than to the directory.
+    """
+    total_bytes = sum(job[3].stat().st_size for job in jobs)
+    if len(jobs) < 2 or total_bytes < _PARALLEL_PARSE_MIN_BYTES:
+        for job in jobs:
+            yield job, _load_dataset_frame(job)
+        return
+
+    workers = min(len(jobs), os.cpu_count() or 1)
+    remaining = iter(jobs)
+    in_flight: Dict[Future, Tuple[str, str, str, Path]] = {}
+    # Spawned workers: this runs inside the API server, whose threads fork() would copy mid-operation
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        try:
+            for job in remaining:
+                in_flight[executor.submit(_load_dataset_frame, job)] = job
+                if len(in_flight) == workers:
+                    break
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = in_flight.pop(future)
+                    next_job = next(remaining, None)
+                    if next_job is not None:
+                        in_flight[executor.submit(_load_dataset_frame, next_job)] = next_job
+                    # Writes stay in this process because SQLite serializes writers anyway
+                    yield job, future.result()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+
 def iter_business_directories(base_path: Path) -> Iterable[Path]:
     for child in sorted(base_path.iterdir()):
         if child.is_dir():
@@ -134,8 +363,7 @@ def ingest_directory(
         )
         return [dataset]
 
-    ingested: List[IngestedDataset] = []
-
+    jobs: List[Tuple[str, str, str, Path]] = []
     for business_dir in iter_business_directories(base_path):
         business_name = business_dir.name
         if business and _normalize_identifier(business) != _normalize_identifier(business_name):
@@ -146,12 +374,13 @@ def ingest_directory(
         for category_slug, csv_file in iter_dataset_files(business_dir):
             dataset_slug = _normalize_identifier(csv_file.stem)
             table_name = f"{business_slug}_{category_slug}_{dataset_slug}"
-            df = _load_csv(csv_file)
-            df["business_name"] = business_name
-            df["category"] = category_slug
-            df["source_file"] = str(csv_file)
+            jobs.append((table_name, business_name, category_slug, csv_file))
+
+    ingested: List[IngestedDataset] = []
 
-            df.to_sql(table_name, work_engine, if_exists="replace", index=False)
+    try:
+        for (table_name, business_name, category_slug, csv_file), df in _iter_dataset_frames(jobs):
+            _write_table(work_engine, table_name, [df])
 
             dataset = IngestedDataset(
                 table_name=table_name,
@@ -162,8 +391,10 @@ def ingest_directory(
                 row_count=len(df),
                 columns=list(df.columns),
             )
-            _record_dataset(work_engine, dataset)
             ingested.append(dataset)
+    finally:
+        # Register everything written so far in one batch, even if a later file failed to load
+        _record_datasets(work_engine, ingested)
 
     return ingested
 
@@ -187,8 +418,6 @@ def ingest_csv_file(
     work_engine = engine_override or engine
     _ensure_registry(work_engine)
 
-    df = _load_csv(csv_path)
-
     business_name = business or "custom_business"
     category_slug = _normalize_identifier(category or "custom")
     dataset_display_name = dataset_name or csv_path.stem
@@ -196,11 +425,8 @@ def ingest_csv_file(
     business_slug = _normalize_identifier(business_name)
     table_name = f"{business_slug}_{category_slug}_{dataset_slug}"
 
-    df["business_name"] = business_name
-    df["category"] = category_slug
-    df["source_file"] = str(csv_path)
-
-    df.to_sql(table_name, work_engine, if_exists="replace", index=False)
+    frames = _tag_chunks(_iter_csv(csv_path), business_name, category_slug, csv_path)
+    row_count, columns = _write_table(work_engine, table_name, frames)
 
     dataset = IngestedDataset(
         table_name=table_name,
@@ -208,8 +434,8 @@ def ingest_csv_file(
         category=category_slug,
         dataset_name=dataset_display_name,
         source_file=str(csv_path),
-        row_count=len(df),
-        columns=list(df.columns),
+        row_count=row_count,
+        columns=columns,
     )
     _record_dataset(work_engine, dataset)
     return dataset
@@ -1,66 +1,117 @@
 """Ingest Shopify marketing events into the analytics warehouse."""
 from __future__ import annotations
 
+import asyncio
+import atexit
+import threading
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import httpx
+import numpy as np
+import orjson
 import pandas as pd
 from sqlalchemy.engine import Engine
 
+from ..core.async_utils import background_loop, run_async
 from ..core.config import settings
 from ..db.session import engine
-from .local_csv_ingestion import IngestedDataset, _ensure_registry, _normalize_identifier, _record_dataset
-
-
-def _build_records(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    records: List[Dict[str, Any]] = []
-    for event in events:
-        engagements = event.get("engagements") or []
-        total_impressions = 0
-        total_clicks = 0
-        total_spend = 0.0
-        for engagement in engagements:
-            if isinstance(engagement, dict):
-                total_impressions += int(engagement.get("impressions") or 0)
-                total_clicks += int(engagement.get("clicks") or 0)
-                total_spend += float(engagement.get("ad_spend") or 0.0)
-
-        record = {
-            "event_id": event.get("id"),
-            "remote_id": event.get("remote_id"),
-            "event_type": event.get("event_type"),
-            "marketing_channel": event.get("marketing_channel"),
-            "budget": event.get("budget"),
-            "currency": event.get("currency"),
-            "started_at": event.get("started_at"),
-            "ended_at": event.get("scheduled_to_end_at"),
-            "utm_campaign": event.get("utm_campaign"),
-            "utm_source": event.get("utm_source"),
-            "utm_medium": event.get("utm_medium"),
-            "utm_content": event.get("utm_content"),
-            "utm_term": event.get("utm_term"),
-            "paid": event.get("paid"),
-            "preview_url": event.get("preview_url"),
-            "status": event.get("status"),
-            "platform": event.get("platform"),
-            "total_impressions": total_impressions,
-            "total_clicks": total_clicks,
-            "total_spend": total_spend,
-        }
-        records.append(record)
-    return records
+from .local_csv_ingestion import (
+    IngestedDataset,
+    _ensure_registry,
+    _normalize_identifier,
+    _record_dataset,
+    _write_table,
+)
+
+
+# Shopify fetches run on the shared background loop so the pooled client (and its TLS connections) is
+# reused across ingests, including those started from sync code or from other event loops
+_CLIENT: Optional[httpx.AsyncClient] = None
+_CLIENT_LOCK = threading.Lock()
+
+# Top-level marketing event fields copied into the warehouse table, keyed by their Shopify name
+_EVENT_FIELDS = {
+    "id": "event_id",
+    "remote_id": "remote_id",
+    "event_type": "event_type",
+    "marketing_channel": "marketing_channel",
+    "budget": "budget",
+    "currency": "currency",
+    "started_at": "started_at",
+    "scheduled_to_end_at": "ended_at",
+    "utm_campaign": "utm_campaign",
+    "utm_source": "utm_source",
+    "utm_medium": "utm_medium",
+    "utm_content": "utm_content",
+    "utm_term": "utm_term",
+    "paid": "paid",
+    "preview_url": "preview_url",
+    "status": "status",
+    "platform": "platform",
+}
+_ENGAGEMENT_TOTALS = {"impressions": "total_impressions", "clicks": "total_clicks", "ad_spend": "total_spend"}
+
+
+def _build_frame(events: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Flatten marketing events into one row per event with engagement totals summed per event."""
+    df = pd.DataFrame.from_records(events, columns=list(_EVENT_FIELDS)).rename(columns=_EVENT_FIELDS)
+    # Fields no event carries stay NULL object columns instead of being inferred as float NaN
+    for name in df.columns[df.isna().all()]:
+        df[name] = pd.Series(None, index=df.index, dtype=object)
+
+    # One row per engagement, tagged with the position of its event so totals join back even without IDs
+    engagements = pd.DataFrame.from_records(
+        [
+            (position, engagement.get("impressions"), engagement.get("clicks"), engagement.get("ad_spend"))
+            for position, event in enumerate(events)
+            for engagement in event.get("engagements") or []
+            if isinstance(engagement, dict)
+        ],
+        columns=["position", *_ENGAGEMENT_TOTALS],
+    )
+    positions = engagements["position"].to_numpy(dtype=np.intp)
+    for source, total in _ENGAGEMENT_TOTALS.items():
+        values = pd.to_numeric(engagements[source], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+        if source != "ad_spend":
+            # Counts are truncated per engagement, matching int() on each value
+            values = np.trunc(values)
+        # Scatter-add each engagement into its event's slot; events without engagements stay 0
+        sums = np.bincount(positions, weights=values, minlength=len(events))
+        # bincount returns int64 when there are no weights at all; keep spend REAL like a non-empty sum
+        df[total] = sums.astype(np.float64) if source == "ad_spend" else sums.astype(np.int64)
+    return df
 
 
-def fetch_shopify_marketing_events(
-    *,
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared Shopify client, creating it on first use."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = httpx.AsyncClient(timeout=30)
+        return _CLIENT
+
+
+def _close_client() -> None:
+    """Close the shared client; the next fetch creates a fresh one."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        client, _CLIENT = _CLIENT, None
+    if client is not None:
+        run_async(client.aclose())
+
+
+atexit.register(_close_client)
+
+
+def _marketing_events_request(
     store_domain: str,
     access_token: str,
-    api_version: Optional[str] = None,
-    start_date: Optional[Union[str, datetime]] = None,
-    end_date: Optional[Union[str, datetime]] = None,
-    limit: int = 250,
-) -> List[Dict[str, Any]]:
+    api_version: Optional[str],
+    start_date: Optional[Union[str, datetime]],
+    end_date: Optional[Union[str, datetime]],
+    limit: int,
+) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
     if not store_domain:
         raise ValueError("Shopify store domain is required")
     if not access_token:
@@ -75,29 +126,61 @@ def fetch_shopify_marketing_events(
         params["started_at_min"] = start_date.isoformat() if isinstance(start_date, datetime) else start_date
     if end_date:
         params["ended_at_max"] = end_date.isoformat() if isinstance(end_date, datetime) else end_date
+    return base_url, headers, params
 
-    events: List[Dict[str, Any]] = []
-    since_id: Optional[int] = None
 
-    with httpx.Client(timeout=30) as client:
-        while True:
-            if since_id:
-                params["since_id"] = since_id
-            response = client.get(base_url, headers=headers, params=params)
+async def _fetch_pages(
+    client: httpx.AsyncClient, base_url: str, headers: Dict[str, str], params: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Fetch every marketing event page, following Shopify's Link header cursors."""
+    events: List[Dict[str, Any]] = []
+    pending: Optional[asyncio.Task[httpx.Response]] = asyncio.ensure_future(
+        client.get(base_url, headers=headers, params=params)
+    )
+    try:
+        while pending is not None:
+            response = await pending
             response.raise_for_status()
-            chunk = response.json().get("marketing_events", [])
-            if not chunk:
-                break
-            events.extend(chunk)
-            if len(chunk) < limit:
-                break
-            since_id = chunk[-1].get("id")
-            if not since_id:
-                break
-
+            # The next page URL (with its page_info cursor and filters) is in the headers, so request it
+            # before decoding this body and let the round trip overlap the parse
+            next_url = response.links.get("next", {}).get("url")
+            pending = asyncio.ensure_future(client.get(next_url, headers=headers)) if next_url else None
+            events.extend(orjson.loads(response.content).get("marketing_events", []))
+    finally:
+        if pending is not None:
+            pending.cancel()
     return events
 
 
+async def fetch_shopify_marketing_events_async(
+    *,
+    store_domain: str,
+    access_token: str,
+    api_version: Optional[str] = None,
+    start_date: Optional[Union[str, datetime]] = None,
+    end_date: Optional[Union[str, datetime]] = None,
+    limit: int = 250,
+) -> List[Dict[str, Any]]:
+    """Fetch every marketing event page, following Shopify's Link header cursors."""
+    request = _marketing_events_request(store_domain, access_token, api_version, start_date, end_date, limit)
+    future = asyncio.run_coroutine_threadsafe(_fetch_pages(_get_client(), *request), background_loop())
+    return await asyncio.wrap_future(future)
+
+
+def fetch_shopify_marketing_events(
+    *,
+    store_domain: str,
+    access_token: str,
+    api_version: Optional[str] = None,
+    start_date: Optional[Union[str, datetime]] = None,
+    end_date: Optional[Union[str, datetime]] = None,
+    limit: int = 250,
+) -> List[Dict[str, Any]]:
+    """Blocking variant of fetch_shopify_marketing_events_async for sync callers."""
+    request = _marketing_events_request(store_domain, access_token, api_version, start_date, end_date, limit)
+    return run_async(_fetch_pages(_get_client(), *request))
+
+
 def ingest_shopify_marketing_events(
     *,
     store_domain: Optional[str] = None,
@@ -120,8 +203,7 @@ def ingest_shopify_marketing_events(
     if not events:
         raise ValueError("No marketing events returned from Shopify")
 
-    records = _build_records(events)
-    df = pd.DataFrame(records)
+    df = _build_frame(events)
     business_name = domain or "shopify_store"
     business_slug = _normalize_identifier(business_name)
     table_name = f"{business_slug}_marketing_events"
@@ -129,7 +211,7 @@ def ingest_shopify_marketing_events(
     work_engine = engine_override or engine
     _ensure_registry(work_engine)
 
-    df.to_sql(table_name, work_engine, if_exists="replace", index=False)
+    _write_table(work_engine, table_name, [df])
 
     dataset = IngestedDataset(
         table_name=table_name,
@@ -152,5 +234,9 @@ def ingest_default_shopify_marketing() -> IngestedDataset:
     return dataset
 
 
-__all__ = ["ingest_shopify_marketing_events", "fetch_shopify_marketing_events"]
+__all__ = [
+    "ingest_shopify_marketing_events",
+    "fetch_shopify_marketing_events",
+    "fetch_shopify_marketing_events_async",
+]
 
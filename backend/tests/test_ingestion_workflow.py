@@ -2,7 +2,9 @@
 from pathlib import Path
 
 import pytest
+from sqlalchemy import create_engine, text
 
+from app.workflows import local_csv_ingestion
 from app.workflows.local_csv_ingestion import ingest_directory
 
 
@@ -12,3 +14,58 @@ def test_ingest_directory_missing_path(tmp_path: Path) -> None:
         ingest_directory(missing_path)
 
 
+def _write_business_tree(base_path: Path) -> None:
+    for business, category, name, rows in [
+        ("Acme", "Sales", "orders", 5),
+        ("Acme", "Ads", "spend", 3),
+        ("Beta", "Sales", "items", 4),
+    ]:
+        category_dir = base_path / business / category
+        category_dir.mkdir(parents=True, exist_ok=True)
+        lines = ["id,amount"] + [f"{index},{index * 1.5}" for index in range(rows)]
+        (category_dir / f"{name}.csv").write_text("\n".join(lines) + "\n")
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_ingest_directory_loads_every_file(monkeypatch: pytest.MonkeyPatch, tmp_path: Path, parallel: bool) -> None:
+    _write_business_tree(tmp_path)
+    if parallel:
+        # Force the process pool even for tiny files
+        monkeypatch.setattr(local_csv_ingestion, "_PARALLEL_PARSE_MIN_BYTES", 0)
+    work_engine = create_engine(f"sqlite:///{tmp_path / 'warehouse.db'}")
+
+    datasets = ingest_directory(tmp_path, engine_override=work_engine)
+
+    row_counts = {dataset.table_name: dataset.row_count for dataset in datasets}
+    assert row_counts == {"acme_ads_spend": 3, "acme_sales_orders": 5, "beta_sales_items": 4}
+    with work_engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM acme_sales_orders")).scalar() == 5
+        registered = connection.execute(text("SELECT COUNT(*) FROM dataset_registry")).scalar()
+    assert registered == 3
+
+
+def test_streamed_chunks_pin_text_and_widen_numbers(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    # After the first chunk: a blank and a decimal in an int column, text in a numeric column, and codes
+    # that look numeric in a text column
+    csv_path = tmp_path / "orders.csv"
+    csv_path.write_text(
+        "quantity,amount,code\n1,1.5,A1\n2,2.5,B2\n3,3.5,C3\n,pending,123\n5.5,6.5,456\n"
+    )
+    monkeypatch.setattr(local_csv_ingestion, "_CSV_STREAM_MIN_BYTES", 0)
+    monkeypatch.setattr(local_csv_ingestion, "_CSV_STREAM_CHUNK_ROWS", 3)
+
+    first, second = local_csv_ingestion._iter_csv(csv_path)
+
+    assert second["quantity"].dtype == "float64"
+    assert second["amount"].tolist() == ["pending", "6.5"]
+    assert second["code"].dtype == first["code"].dtype
+    assert second["code"].tolist() == ["123", "456"]
+
+    work_engine = create_engine(f"sqlite:///{tmp_path / 'warehouse.db'}")
+    dataset = local_csv_ingestion.ingest_csv_file(csv_path, engine_override=work_engine, business="Acme")
+
+    assert dataset.row_count == 5
+    assert dataset.columns == ["quantity", "amount", "code", "business_name", "category", "source_file"]
+    with work_engine.connect() as connection:
+        codes = connection.execute(text(f"SELECT code FROM {dataset.table_name} ORDER BY rowid")).scalars().all()
+    assert codes == ["A1", "B2", "C3", "123", "456"]
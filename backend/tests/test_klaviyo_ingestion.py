@@ -0,0 +1,51 @@
+"""Tests for Klaviyo campaign CSV ingestion."""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from app.workflows.klaviyo_ingestion import _build_campaign_records, ingest_klaviyo_csv
+
+_CSV = (
+    "Campaign ID,Campaign Name,Subject,Total Recipients,Unique Opens,Open Rate,Revenue\n"
+    "C1,Alpha,Hi,100,40,40%,100.5\n"
+    ",Beta Sale,Yo,50,10,20%,10\n"
+    ",,,1,1,1%,1\n"
+    "C1,Alpha Resend,Hi again,200,80,0.4,200\n"
+)
+
+
+def _ingest_twice(tmp_path: Path):
+    csv_path = tmp_path / "klaviyo.csv"
+    csv_path.write_text(_CSV)
+    work_engine = create_engine(f"sqlite:///{tmp_path / 'warehouse.db'}")
+    first = ingest_klaviyo_csv(str(csv_path), db_engine=work_engine)
+    second = ingest_klaviyo_csv(str(csv_path), db_engine=work_engine)
+    return work_engine, first, second
+
+
+def test_reingesting_same_csv_counts_updates(tmp_path: Path) -> None:
+    work_engine, first, second = _ingest_twice(tmp_path)
+
+    # The repeated C1 row updates the row its first occurrence inserted
+    assert (first["inserted"], first["updated"]) == (2, 1)
+    assert (second["inserted"], second["updated"]) == (0, 3)
+    assert first["errors"] == ["Row 3: Missing campaign_id and campaign_name"]
+    with work_engine.connect() as connection:
+        rows = connection.execute(
+            text("SELECT campaign_id, campaign_name, sent_count, open_rate FROM campaigns ORDER BY id")
+        ).all()
+    assert rows == [("C1", "Alpha Resend", 200, 0.4), ("beta_sale", "Beta Sale", 50, 0.2)]
+
+
+def test_missing_campaign_id_falls_back_to_campaign_name() -> None:
+    df = pd.DataFrame({"campaign_id": [np.nan, "C2", None], "campaign_name": ["Spring Sale!", None, np.nan]})
+
+    records, errors = _build_campaign_records(df, "2024-01-01T00:00:00")
+
+    assert [(record["campaign_id"], record["campaign_name"]) for record in records] == [
+        ("spring_sale", "Spring Sale!"),
+        ("C2", None),
+    ]
+    assert errors == ["Row 3: Missing campaign_id and campaign_name"]
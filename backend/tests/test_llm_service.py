@@ -0,0 +1,27 @@
+"""Tests for LLM-generated SQL validation."""
+import logging
+
+import pytest
+
+from app.services.llm_service import LLMService
+
+_COLUMNS = {"acme_sales_orders": ["order_id", "revenue", "created_at"]}
+
+
+def test_quoted_aliases_are_not_reported_as_unknown_columns(caplog: pytest.LogCaptureFixture) -> None:
+    sql = (
+        'SELECT SUM("revenue") AS "Total Revenue" FROM "acme_sales_orders" '
+        'GROUP BY "created_at" ORDER BY "Total Revenue" DESC'
+    )
+    with caplog.at_level(logging.WARNING, logger="app.services.llm_service"):
+        assert LLMService(provider="ollama")._validate_and_fix_sql_columns(sql, _COLUMNS) == sql
+    assert not caplog.records
+
+
+def test_unknown_quoted_columns_are_reported(caplog: pytest.LogCaptureFixture) -> None:
+    sql = 'SELECT "revenue", "discount" AS "Discount Total" FROM "acme_sales_orders"'
+    with caplog.at_level(logging.WARNING, logger="app.services.llm_service"):
+        LLMService(provider="ollama")._validate_and_fix_sql_columns(sql, _COLUMNS)
+    assert [record.getMessage() for record in caplog.records] == [
+        "Generated SQL references unknown columns: discount"
+    ]
@@ -0,0 +1,104 @@
+"""Tests for prompt-to-SQL result caching."""
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+
+from app.core.config import settings
+from app.services.prompt_sql_service import PromptToSqlService
+from app.workflows.local_csv_ingestion import ingest_csv_file
+
+
+def _service(monkeypatch: pytest.MonkeyPatch, provider: str, embed=None) -> tuple[PromptToSqlService, list]:
+    monkeypatch.setattr(settings, "enable_semantic_cache", True)
+    service = PromptToSqlService(db_engine=create_engine("sqlite://"), use_llm=False)
+    service.use_llm = True
+    service.llm_service = SimpleNamespace(provider=provider, embed_text=embed)
+    service.semantic_cache = service._build_semantic_cache()
+
+    llm_prompts: list = []
+
+    def fake_llm(prompt, datasets, sample_rows):
+        llm_prompts.append(prompt)
+        return {"prompt": prompt}
+
+    monkeypatch.setattr(service, "_execute_prompt_llm", fake_llm)
+    return service, llm_prompts
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ("show orders for brand alpha in 2023", "show orders for brand alpha in 2024"),
+        ("revenue by month for shop_a", "revenue by month for shop_b"),
+    ],
+)
+def test_near_miss_prompts_are_not_served_from_cache_without_embedding_model(
+    monkeypatch: pytest.MonkeyPatch, first: str, second: str
+) -> None:
+    service, llm_prompts = _service(monkeypatch, provider="ollama")
+    assert service.semantic_cache is None
+
+    assert service._execute_prompt_llm_cached(first, [], [])["prompt"] == first
+    assert service._execute_prompt_llm_cached(second, [], [])["prompt"] == second
+    assert llm_prompts == [first, second]
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ("revenue for shop A in 2023", "revenue for shop B in 2024"),
+        ("show orders for brand alpha in 2023", "show orders for brand alpha in 2024"),
+        ("revenue by month for shop_a", "revenue by month for shop_b"),
+    ],
+)
+def test_semantic_cache_requires_matching_literals(monkeypatch: pytest.MonkeyPatch, first: str, second: str) -> None:
+    # Worst case for the embedding: every prompt looks identical
+    monkeypatch.setattr(settings, "openai_api_key", "test-key")
+    service, llm_prompts = _service(monkeypatch, provider="openai", embed=lambda text_value: [1.0, 0.0])
+
+    assert service._execute_prompt_llm_cached(first, [], [])["prompt"] == first
+    assert service._execute_prompt_llm_cached(second, [], [])["prompt"] == second
+    # A paraphrase with the same literals is still served from the cache
+    assert service._execute_prompt_llm_cached(f"please {first}", [], [])["prompt"] == first
+    assert llm_prompts == [first, second]
+
+
+def test_semantic_cache_requires_openai_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "openai_api_key", "")
+    service, _ = _service(monkeypatch, provider="openai", embed=lambda text_value: [1.0, 0.0])
+    assert service.semantic_cache is None
+
+
+def test_ingest_invalidates_semantic_cache(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setattr(settings, "openai_api_key", "test-key")
+    service, llm_prompts = _service(monkeypatch, provider="openai", embed=lambda text_value: [1.0, 0.0])
+    assert service.semantic_cache is not None
+
+    prompt = "total revenue by channel"
+    service._execute_prompt_llm_cached(prompt, [], [])
+    service._execute_prompt_llm_cached(prompt, [], [])
+    assert llm_prompts == [prompt]
+
+    csv_path = tmp_path / "orders.csv"
+    csv_path.write_text("order_id,revenue\n1,10.0\n2,12.5\n")
+    ingest_csv_file(csv_path, engine_override=create_engine("sqlite://"), business="Acme", category="sales")
+
+    service._execute_prompt_llm_cached(prompt, [], [])
+    assert llm_prompts == [prompt, prompt]
+
+
+def test_registry_cache_is_per_engine_not_per_url(tmp_path: Path) -> None:
+    # Every in-memory SQLite engine reports the URL "sqlite://"
+    acme_engine, beta_engine = create_engine("sqlite://"), create_engine("sqlite://")
+    csv_path = tmp_path / "orders.csv"
+    csv_path.write_text("order_id,revenue\n1,10.0\n")
+    ingest_csv_file(csv_path, engine_override=acme_engine, business="Acme")
+    ingest_csv_file(csv_path, engine_override=beta_engine, business="Beta", dataset_name="returns")
+
+    acme = PromptToSqlService(db_engine=acme_engine, use_llm=False)._load_registry()
+    beta = PromptToSqlService(db_engine=beta_engine, use_llm=False)._load_registry()
+
+    assert [row["table_name"] for row in acme] == ["acme_custom_orders"]
+    assert [row["table_name"] for row in beta] == ["beta_custom_returns"]
@@ -0,0 +1,69 @@
+"""Tests for Shopify marketing event ingestion."""
+from typing import List
+
+import httpx
+import numpy as np
+import pytest
+
+from app.workflows import shopify_marketing_ingestion
+from app.workflows.shopify_marketing_ingestion import _build_frame, fetch_shopify_marketing_events
+
+
+def test_build_frame_without_engagements_keeps_spend_float() -> None:
+    df = _build_frame([{"id": 1, "event_type": "ad"}, {"id": 2, "event_type": "post", "engagements": []}])
+
+    assert df["total_spend"].dtype == np.float64
+    assert df["total_spend"].tolist() == [0.0, 0.0]
+    assert df["total_impressions"].dtype == np.int64
+    assert df["total_clicks"].tolist() == [0, 0]
+
+
+def test_build_frame_sums_engagements_per_event() -> None:
+    df = _build_frame(
+        [
+            {"id": 1, "engagements": [{"impressions": 10, "clicks": 2.7, "ad_spend": "1.5"}, {"ad_spend": 2}]},
+            {"id": 2},
+        ]
+    )
+
+    assert df["total_impressions"].tolist() == [10, 0]
+    assert df["total_clicks"].tolist() == [2, 0]
+    assert df["total_spend"].tolist() == [3.5, 0.0]
+
+
+def test_fetch_follows_link_pages_and_closes_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    base_url = "https://shop.test/admin/api/2024-04/marketing_events.json"
+    pages = {
+        None: ([{"id": 1}, {"id": 2}], f'<{base_url}?limit=2&page_info=p2>; rel="next"'),
+        "p2": (
+            [{"id": 3}, {"id": 4}],
+            f'<{base_url}?limit=2&page_info=p1>; rel="previous", <{base_url}?limit=2&page_info=p3>; rel="next"',
+        ),
+        "p3": ([{"id": 5}], f'<{base_url}?limit=2&page_info=p2>; rel="previous"'),
+    }
+    requests: List[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        events, link = pages[request.url.params.get("page_info")]
+        return httpx.Response(200, json={"marketing_events": events}, headers={"Link": link})
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        shopify_marketing_ingestion.httpx,
+        "AsyncClient",
+        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs),
+    )
+    shopify_marketing_ingestion._close_client()
+
+    events = fetch_shopify_marketing_events(
+        store_domain="shop.test", access_token="token", api_version="2024-04", limit=2
+    )
+    client = shopify_marketing_ingestion._CLIENT
+    shopify_marketing_ingestion._close_client()
+
+    assert [event["id"] for event in events] == [1, 2, 3, 4, 5]
+    assert [request.url.params.get("page_info") for request in requests] == [None, "p2", "p3"]
+    assert all(request.headers["X-Shopify-Access-Token"] == "token" for request in requests)
+    assert client.is_closed
+    assert shopify_marketing_ingestion._CLIENT is None